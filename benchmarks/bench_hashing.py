@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro benchmark of video file hashing
+
+Compares pysub_objects.hashing.hash_file against the original
+implementation that read and unpacked the file 8 bytes at a time.
+
+Usage: python benchmarks/bench_hashing.py [number_of_runs]
+"""
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import struct
+import timeit
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+from pysub.pysub_objects.hashing import hash_file
+
+
+def loop_hash(file_path):
+    """
+    Original hash implementation, one read and unpack per 8 bytes
+    """
+    file_size = os.path.getsize(file_path)
+    longlongformat = 'q'  # long long
+    bytesize = struct.calcsize(longlongformat)
+
+    with open(file_path, "rb") as in_file:
+        file_hash = file_size
+
+        for _ in range(65536 // bytesize):
+            file_buffer = in_file.read(bytesize)
+            (l_value,) = struct.unpack(longlongformat, file_buffer)
+            file_hash += l_value
+            file_hash &= 0xFFFFFFFFFFFFFFFF
+
+        in_file.seek(max(0, file_size - 65536), 0)
+        for _ in range(65536 // bytesize):
+            file_buffer = in_file.read(bytesize)
+            (l_value,) = struct.unpack(longlongformat, file_buffer)
+            file_hash += l_value
+            file_hash &= 0xFFFFFFFFFFFFFFFF
+        return "%016x" % file_hash
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("runs", type=int, nargs="?", default=200,
+                        help="number of times every file is hashed")
+    runs = parser.parse_args().runs
+
+    with tempfile.NamedTemporaryFile(suffix=".mkv", delete=False) as video:
+        video.write(os.urandom(65536))
+        video.seek(700 * 1024 * 1024 - 65536)
+        video.write(os.urandom(65536))
+
+    try:
+        assert loop_hash(video.name) == hash_file(video.name)
+
+        for name, func in (("8 byte loop", loop_hash),
+                           ("hash_file", hash_file)):
+            seconds = timeit.timeit(lambda: func(video.name), number=runs)
+            print("{:<12} {:>8.3f} ms/file".format(name,
+                                                   seconds / runs * 1000))
+    finally:
+        os.remove(video.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Memory used by Subtitle instances
+
+Builds Subtitle instances from a synthetic response with many
+results and reports memory allocated for them with tracemalloc.
+
+Usage: python benchmarks/bench_memory.py [number_of_results]
+"""
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+from pysub.pysub_objects import Subtitle
+
+
+def response(count):
+    """
+    Synthetic SearchSubtitles response with count results, strings are
+    built separately for every result like xmlrpc client does
+    """
+    shows = ["Show Name", "Other Show", "Third Show"]
+    return {'status': '200 OK',
+            'data': [{'MatchedBy': "moviehash" if num % 3 else "fulltext",
+                      'MovieName': '"{}" Episode'.format(shows[num % 3]),
+                      'SeriesEpisode': str(num % 20 + 1),
+                      'SeriesSeason': str(num % 5 + 1),
+                      'SubDownloadLink': "http://dl.opensubtitles.org/en/"
+                                         "download/filead/{}.gz".format(num),
+                      'SubDownloadsCnt': str(num % 1000),
+                      'SubFormat': "srt",
+                      'SubFileName': "{}.S01E{:02d}.srt".format(
+                          shows[num % 3], num % 20 + 1)}
+                     for num in range(count)]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("results", type=int, nargs="?", default=100000,
+                        help="number of subtitles in the response")
+    count = parser.parse_args().results
+    full_json = response(count)
+
+    tracemalloc.start()
+    subtitles = [Subtitle(subtitle_json, "/videos/", "video.mkv")
+                 for subtitle_json in full_json['data']]
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("{} subtitles {:.1f} MiB, {:.0f} bytes/subtitle, "
+          "peak {:.1f} MiB".format(len(subtitles), size / 2 ** 20,
+                                   size / count, peak / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
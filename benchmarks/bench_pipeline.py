@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the whole search_subtitles pipeline
+
+Generates a tree of sparse video files of realistic sizes, starts
+benchmarks/mock_server.py and runs search_subtitles over the tree with
+automatic download, once with empty caches and once more with the
+caches it filled and downloaded subtitles removed.
+
+Reports files per second, API calls and downloads per file, p50/p99
+latency of API calls and downloads as seen by the client, including
+rate limiter waits, and peak RSS of the process.
+
+Usage: python benchmarks/bench_pipeline.py [--files N] [--latency SECONDS]
+                                           [--jobs N] [--batch N]
+                                           [--queries STRATEGY] [--rate N]
+"""
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import contextlib
+import xmlrpc.client as xmlrpclib
+
+benchmarks = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarks, ".."))
+sys.path.insert(0, benchmarks)
+
+# caches are kept in a temporary app data dir, set before settings
+# module computes their paths
+data_dir = tempfile.mkdtemp(prefix="pysub-bench-data-")
+os.environ['XDG_DATA_HOME'] = data_dir
+
+import mock_server
+from pysub import pysub
+from pysub.pysub_objects import OpenSubtitlesServer, Subtitle
+
+SHOWS = ["Show Name", "Other Show", "The Third Show", "Fourth", "Last Show"]
+
+
+def make_tree(folder, count, rand):
+    """
+    Create count sparse video files in Show/Season N folders, only the
+    parts read by the hash are written so every file hashes differently
+
+    Returns:
+        sorted list of absolute video paths
+    """
+    paths = []
+    for num in range(count):
+        show = SHOWS[num % len(SHOWS)]
+        season, episode = divmod(num // len(SHOWS), 20)
+        season_folder = os.path.join(folder, show,
+                                     "Season {}".format(season + 1))
+        os.makedirs(season_folder, exist_ok=True)
+        path = os.path.join(season_folder,
+                            "{}.S{:02d}E{:02d}.720p.HDTV.x264.mkv".format(
+                                show.replace(" ", "."), season + 1,
+                                episode + 1))
+        size = rand.randint(350, 1500) * 1024 * 1024
+        with open(path, "wb") as video:
+            video.write(os.urandom(65536))
+            video.seek(size - 65536)
+            video.write(os.urandom(65536))
+        paths.append(path)
+    return sorted(paths)
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1,
+                      int(round(percent / 100.0 * (len(values) - 1))))]
+
+
+class Timings(object):
+    """Client side duration of every API call and download"""
+
+    def __init__(self):
+        self.calls = []
+        self.downloads = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def patched(self):
+        call = OpenSubtitlesServer.call
+        download = Subtitle.download
+        timings = self
+
+        def timed_call(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return call(self, *args, **kwargs)
+            finally:
+                with timings._lock:
+                    timings.calls.append(time.perf_counter() - start)
+
+        def timed_download(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return download(self, *args, **kwargs)
+            finally:
+                with timings._lock:
+                    timings.downloads.append(time.perf_counter() - start)
+
+        OpenSubtitlesServer.call = timed_call
+        Subtitle.download = timed_download
+        try:
+            yield self
+        finally:
+            OpenSubtitlesServer.call = call
+            Subtitle.download = download
+
+
+def run(name, paths, config, stats):
+    timings = Timings()
+    stats.BenchReset()
+    start = time.perf_counter()
+    with timings.patched(), open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        pysub.search_subtitles(paths, config)
+    seconds = time.perf_counter() - start
+    calls = stats.BenchStats()
+    api_calls = sum(count for method, count in calls.items()
+                    if method != 'download')
+
+    print("{:<5} {:>6} {:>9.1f} {:>10.2f} {:>10.2f} {:>7.1f} {:>7.1f} "
+          "{:>7.1f} {:>7.1f} {:>8.1f}".format(
+              name, len(paths), len(paths) / seconds,
+              api_calls / len(paths), calls.get('download', 0) / len(paths),
+              percentile(timings.calls, 50) * 1000,
+              percentile(timings.calls, 99) * 1000,
+              percentile(timings.downloads, 50) * 1000,
+              percentile(timings.downloads, 99) * 1000,
+              resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="search_subtitles "
+                                                 "benchmark")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds every mock server request takes")
+    parser.add_argument("--results", type=int, default=3,
+                        help="subtitles found by every query")
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=10)
+    parser.add_argument("--queries", default="both",
+                        choices=pysub.QueryPlanner.strategies)
+    parser.add_argument("--rate", type=float, default=0,
+                        help="requests per second, 0 for no limit")
+    args = parser.parse_args()
+
+    url, server_process = mock_server.start(args.latency, args.results)
+    tree = tempfile.mkdtemp(prefix="pysub-bench-tree-")
+    try:
+        paths = make_tree(tree, args.files, random.Random(1))
+        # download_prompt reads module config, so it's changed in place
+        config = pysub.config
+        config.update(server=url, auto_download=True, jobs=args.jobs,
+                      batch_size=args.batch, query_strategy=args.queries,
+                      rate_limit=args.rate)
+        stats = xmlrpclib.ServerProxy(url)
+
+        print("{:<5} {:>6} {:>9} {:>10} {:>10} {:>7} {:>7} {:>7} {:>7} "
+              "{:>8}".format("run", "files", "files/s", "calls/file",
+                             "dl/file", "p50 ms", "p99 ms", "dl p50",
+                             "dl p99", "RSS MB"))
+        run("cold", paths, config, stats)
+
+        for path in paths:
+            subtitle = path + ".srt"
+            if os.path.exists(subtitle):
+                os.remove(subtitle)
+        run("warm", paths, config, stats)
+    finally:
+        server_process.terminate()
+        shutil.rmtree(tree)
+        shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro benchmark of automatic subtitle choice
+
+Ranks a few hundred subtitles for one video with
+pysub_objects.ranking.Ranker and reports time per subtitle.
+
+Usage: python benchmarks/bench_ranking.py [number_of_subtitles]
+"""
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import random
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+from pysub.pysub_objects import Ranker, Subtitle, guess_episode_info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("subtitles", type=int, nargs="?", default=300,
+                        help="number of subtitles ranked")
+    count = parser.parse_args().subtitles
+    rand = random.Random(1)
+    names = ["Show Name", "Other Show", "Show", "Name Show"]
+
+    subtitles = []
+    for _ in range(count):
+        series = rand.choice(names)
+        file_name = "{}.S01E{:02d}.720p.HDTV.x264.srt".format(
+            series.replace(" ", "."), rand.randint(1, 10))
+        subtitles.append(Subtitle({'MatchedBy': rand.choice(["moviehash",
+                                                             "fulltext"]),
+                                   'MovieName': '"{}" Episode'.format(series),
+                                   'SubDownloadsCnt': rand.randint(0, 500),
+                                   'SubFormat': 'srt',
+                                   'SubFileName': file_name},
+                                  os.sep, "video.mkv"))
+
+    ep_info = guess_episode_info("Show.Name.S01E02.Pilot.720p.mkv")
+
+    # first run fills guessit memo, as it would be on popular shows
+    Ranker(ep_info, 0.75).rank(subtitles)
+    runs = 20
+    seconds = timeit.timeit(lambda: Ranker(ep_info, 0.75).rank(subtitles),
+                            number=runs)
+    print("{} subtitles {:>8.4f} ms/subtitle".format(
+        count, seconds / runs / count * 1000))
+
+
+if __name__ == '__main__':
+    main()
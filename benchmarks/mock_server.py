@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for OpenSubtitles XMLRPC API
+
+Answers LogIn, LogOut, NoOperation and SearchSubtitles with synthetic
+results after a configurable latency, and serves gzipped subtitles
+from /download/<id>.gz. Runs in its own process so it doesn't share
+the GIL or memory with the benchmarked client. BenchStats and
+BenchReset return and reset the number of calls of every method.
+
+Usage: python benchmarks/mock_server.py [--port PORT] [--latency SECONDS]
+"""
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import time
+import argparse
+import threading
+import collections
+import multiprocessing
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+SUBTITLE = gzip.compress(b"".join(
+    "{}\n00:00:{:02d},000 --> 00:00:{:02d},500\nLine {}\n\n".format(
+        num, num % 60, num % 60, num).encode('utf-8')
+    for num in range(1, 400)))
+
+
+class MockHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ()
+
+    def do_GET(self):
+        if not self.path.startswith("/download/"):
+            self.send_error(404)
+            return
+        self.server.count('download')
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-gzip")
+        self.send_header("Content-Length", str(len(SUBTITLE)))
+        self.end_headers()
+        self.wfile.write(SUBTITLE)
+
+    def log_message(self, *args):
+        pass
+
+
+class MockServer(ThreadingMixIn, SimpleXMLRPCServer):
+    """XMLRPC server with OpenSubtitles methods used by pysub
+
+    Attributes:
+        latency: float, seconds every request is delayed by
+        results: int, subtitles found by every query for every language
+
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, results=3):
+        SimpleXMLRPCServer.__init__(self, ("127.0.0.1", port),
+                                    requestHandler=MockHandler,
+                                    logRequests=False, allow_none=True)
+        self.latency = latency
+        self.results = results
+        self.calls = collections.Counter()
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+        for name in ('LogIn', 'LogOut', 'NoOperation', 'SearchSubtitles',
+                     'BenchStats', 'BenchReset'):
+            self.register_function(getattr(self, name), name)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def count(self, method):
+        with self._lock:
+            self.calls[method] += 1
+
+    def _call(self, method):
+        self.count(method)
+        time.sleep(self.latency)
+
+    def LogIn(self, username, password, language, user_agent):
+        self._call('LogIn')
+        return {'status': '200 OK', 'token': 'benchmark'}
+
+    def LogOut(self, token):
+        self._call('LogOut')
+        return {'status': '200 OK'}
+
+    def NoOperation(self, token):
+        self._call('NoOperation')
+        return {'status': '200 OK'}
+
+    def SearchSubtitles(self, token, queries):
+        self._call('SearchSubtitles')
+        data = []
+        for num, query in enumerate(queries):
+            by_hash = 'moviehash' in query
+            name = query.get('query', "Show S01E01")
+            languages = query.get('sublanguageid', "eng").split(",")
+            for result in range(self.results * len(languages)):
+                language = languages[result % len(languages)]
+                with self._lock:
+                    self._next_id += 1
+                    sub_id = self._next_id
+                data.append({
+                    'QueryNumber': str(num),
+                    'IDSubtitleFile': str(sub_id),
+                    'MatchedBy': 'moviehash' if by_hash else 'fulltext',
+                    'MovieHash': query.get('moviehash', "0"),
+                    'MovieName': '"{}" Episode'.format(name.split(" S")[0]),
+                    'SeriesSeason': str(query.get('season', "1")),
+                    'SeriesEpisode': str(query.get('episode', "1")),
+                    'SubDownloadsCnt': str(1000 - result),
+                    'SubFormat': 'srt',
+                    'SubLanguageID': language,
+                    'SubFileName': "{}.{}.srt".format(
+                        name.replace(" ", "."), result),
+                    'SubDownloadLink': "{}/download/{}.gz".format(
+                        self.url, sub_id),
+                })
+        return {'status': '200 OK', 'data': data}
+
+    def BenchStats(self):
+        with self._lock:
+            return dict(self.calls)
+
+    def BenchReset(self):
+        with self._lock:
+            self.calls.clear()
+        return True
+
+
+def _serve(port, latency, results, url_queue):
+    server = MockServer(port, latency, results)
+    url_queue.put(server.url)
+    server.serve_forever()
+
+
+def start(latency=0.0, results=3, port=0):
+    """
+    Start mock server in a new process
+
+    Args:
+        latency: float, seconds every request is delayed by
+        results: int, subtitles found by every query for every language
+        port: int, port to listen on, 0 for any free port
+
+    Returns:
+        tuple of server url and multiprocessing.Process, terminate
+        the process to stop the server
+    """
+    url_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve,
+                                      args=(port, latency, results,
+                                            url_queue),
+                                      daemon=True)
+    process.start()
+    return url_queue.get(timeout=30), process
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--results", type=int, default=3)
+    args = parser.parse_args()
+
+    server = MockServer(args.port, args.latency, args.results)
+    print("Serving on {}".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
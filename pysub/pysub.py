@@ -20,74 +20,899 @@ Command line command-line user interface
 # limitations under the License.
 
 import os
+import sys
+import time
+import atexit
+import sqlite3
 import argparse
+import threading
+import contextlib
+import collections
+from concurrent.futures import ThreadPoolExecutor
 
 try:
-    from pysub.pysub_objects import Video, OpenSubtitlesServer
-    from pysub.settings import default_config as config
+    from pysub.pysub_objects import (Video, OpenSubtitlesServer, HashCache,
+                                     DirectoryCache, SearchCache, ParseCache,
+                                     JobJournal, Scanner, SubtitleIndex,
+                                     Watcher, default_pool, QueryPlanner,
+                                     hash_files, use_parse_cache,
+                                     default_limiter, default_metrics,
+                                     FileResult, SQLiteStore,
+                                     SharedSearchCache, partition, shard_key,
+                                     SHARD_BY)
+    from pysub.settings import (default_config as config, hash_cache_file,
+                                directory_cache_file, search_cache_file,
+                                parse_cache_file, journal_file)
     from pysub import __version__
 except ImportError:
-    from pysub_objects import Video, OpenSubtitlesServer
-    from settings import default_config as config
+    from pysub_objects import (Video, OpenSubtitlesServer, HashCache,
+                               DirectoryCache, SearchCache, ParseCache,
+                               JobJournal, Scanner, SubtitleIndex, Watcher,
+                               default_pool, QueryPlanner, hash_files,
+                               use_parse_cache, default_limiter,
+                               default_metrics, FileResult, SQLiteStore,
+                               SharedSearchCache, partition, shard_key,
+                               SHARD_BY)
+    from settings import (default_config as config, hash_cache_file,
+                          directory_cache_file, search_cache_file,
+                          parse_cache_file, journal_file)
     from __init__ import __version__
 
 
-def search_subtitles(file_list, config):
+def ordered_map(func, items, jobs):
+    """
+    Apply func to every item using a pool of worker threads and yield
+    results in the same order as items. At most 2 * jobs items are in
+    flight at once so long lists don't pile up finished results.
+
+    Pending work is cancelled if the consumer stops iterating, e.g.
+    on KeyboardInterrupt, and work already running is waited for, so
+    nothing is left running when the generator is closed.
+
+    Args:
+        func: callable taking one item
+        items: iterable of arguments for func
+        jobs: int, number of worker threads, 1 or less runs in
+              the calling thread
+
+    Yields:
+        func(item) for every item, in order
+    """
+    if jobs <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    pending = collections.deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def open_cache(cache_class, cache_file, quiet=False, **kwargs):
+    """
+    Open persistent cache stored in cache_file.
+
+    Args:
+        cache_class: SQLiteCache subclass
+        cache_file: str, absolute path of database file
+        quiet: bool, don't print anything if it can't be opened
+        kwargs: passed to cache_class
+
+    Returns:
+        cache_class instance or None if it can't be opened
+    """
+    try:
+        return cache_class(cache_file, **kwargs)
+    except (OSError, sqlite3.Error):
+        if not quiet:
+            print("Can't open cache {}".format(cache_file))
+        return None
+
+
+def resume_jobs(file_list, journal, quiet=False):
+    """
+    Leave out videos handled by a previous run, see
+    JobJournal.finished, and collect hashes it stored.
+
+    Args:
+        file_list: list, absolute paths of videos
+        journal: JobJournal instance
+        quiet: bool, don't print how many videos were skipped
+
+    Returns:
+        tuple of list of remaining file paths and dict with file
+        path as key and stored hash as value
+    """
+    remaining = []
+    hashes = {}
+    for file_path in file_list:
+        if journal.finished(file_path):
+            continue
+        remaining.append(file_path)
+        try:
+            stored = journal.get(file_path)
+        except OSError:
+            stored = None
+        if stored and stored[1]:
+            hashes[file_path] = stored[1]
+
+    if not quiet:
+        print("Resuming, skipped {} videos handled by previous "
+              "run".format(len(file_list) - len(remaining)))
+    return remaining, hashes
+
+
+def has_subtitles(file_path, config, sub_index=None):
+    """
+    Check if every subtitle searched for exists for video
+
+    Args:
+        file_path: str, absolute path of video
+        config: dict, run configuration
+        sub_index: SubtitleIndex with already listed folders, if any
+
+    Returns:
+        True if all subtitles exist or video doesn't exist anymore,
+        False otherwise
+    """
+    try:
+        return Video(file_path, config, sub_index=sub_index).sub_exists
+    except OSError:
+        return True
+
+
+def hash_videos(file_list, config, hash_cache=None, journal=None):
+    """
+    Hash all files from file_list up front with config['hash_jobs']
+    workers, reading at most config['hash_per_device'] files from
+    the same disk at once. Files found in hash_cache are not read.
+
+    Args:
+        file_list: list, absolute paths of videos to hash
+        hash_cache: HashCache instance or None
+        journal: JobJournal new hashes are recorded in, or None
+
+    Returns:
+        dict with file path as key and hash, or None, as value
+    """
+    hashes = {}
+    missing = []
+    for file_path in file_list:
+        try:
+            hashes[file_path] = hash_cache and hash_cache.get(file_path)
+        except OSError:
+            hashes[file_path] = None
+        if not hashes[file_path]:
+            missing.append(file_path)
+    if hash_cache:
+        default_metrics.count('hash_cache_hits',
+                              len(file_list) - len(missing))
+        default_metrics.count('hash_cache_misses', len(missing))
+
+    hashes.update(hash_files(missing,
+                             jobs=config['hash_jobs'],
+                             per_device=config['hash_per_device'],
+                             processes=config['hash_processes']))
+
+    for file_path in missing:
+        if not hashes[file_path]:
+            continue
+        try:
+            if hash_cache:
+                hash_cache.set(file_path, hashes[file_path])
+            if journal:
+                journal.set(file_path, JobJournal.HASHED, hashes[file_path])
+        except OSError:
+            pass
+    return hashes
+
+
+Caches = collections.namedtuple('Caches', ['hash_cache', 'parse_cache',
+                                           'search_cache', 'journal',
+                                           'store'])
+Caches.__doc__ = """Persistent caches used by one run, see open_caches
+
+Attributes:
+    hash_cache: HashCache or None
+    parse_cache: ParseCache or None
+    search_cache: SearchCache, SharedSearchCache or None
+    journal: JobJournal or None
+    store: SharedStore or None
+"""
+
+
+@contextlib.contextmanager
+def open_caches(config, quiet=False):
+    """
+    Open caches enabled in config, they're closed when the block exits
+
+    With config['store'] set search results are kept in the shared
+    store instead of the local search cache, and the request rate
+    limit is shared with everyone else using the store.
+
+    Args:
+        config: dict, run configuration
+        quiet: bool, don't print caches that can't be opened
+
+    Yields:
+        Caches, disabled caches and ones that can't be opened are None
+    """
+    hash_cache = None
+    if config['hash_cache']:
+        hash_cache = open_cache(HashCache, hash_cache_file, quiet)
+    parse_cache = None
+    if config['parse_cache']:
+        parse_cache = open_cache(ParseCache, parse_cache_file, quiet)
+        use_parse_cache(parse_cache)
+    store = None
+    if config['store']:
+        store = open_cache(SQLiteStore, config['store'], quiet)
+        if store:
+            default_limiter.use_store(store)
+    search_cache = None
+    if config['search_cache'] and store:
+        search_cache = SharedSearchCache(
+            store, ttl=config['search_ttl'],
+            negative_ttl=config['search_negative_ttl'],
+            refresh=config['refresh'])
+    elif config['search_cache']:
+        search_cache = open_cache(SearchCache, search_cache_file, quiet,
+                                  ttl=config['search_ttl'],
+                                  negative_ttl=config['search_negative_ttl'],
+                                  max_entries=config['search_cache_size'],
+                                  refresh=config['refresh'])
+    journal = None
+    if config['journal']:
+        journal = open_cache(JobJournal, journal_file, quiet,
+                             ttl=config['journal_ttl'],
+                             languages=config['lang'])
+    try:
+        yield Caches(hash_cache, parse_cache, search_cache, journal, store)
+    finally:
+        if hash_cache:
+            hash_cache.close()
+        if search_cache:
+            search_cache.close()
+        if parse_cache:
+            use_parse_cache(None)
+            parse_cache.close()
+        if journal:
+            journal.close()
+        if store:
+            default_limiter.use_store(None)
+            store.close()
+
+
+def prepare_files(file_list, config, caches, quiet=False):
+    """
+    Leave out videos finished by a previous run if config['resume']
+    is set, and hash all files up front if config['hash_jobs'] is
+    larger than 1, see resume_jobs and hash_videos
+
+    Args:
+        file_list: list, absolute paths of videos
+        caches: Caches of the run
+        quiet: bool, don't print how many videos were resumed
+
+    Returns:
+        tuple of list of remaining file paths and dict with file
+        path as key and hash, or None, as value
+    """
+    hashes = {}
+    if caches.journal and config['resume']:
+        file_list, hashes = resume_jobs(file_list, caches.journal,
+                                        quiet)
+    if config['hash_jobs'] > 1 and config['query_strategy'] != 'name-only':
+        hashes.update(hash_videos([file_path for file_path in file_list
+                                   if file_path not in hashes],
+                                  config, caches.hash_cache, caches.journal))
+    return file_list, hashes
+
+
+def search_videos(file_list, config, caches, hashes=None, sub_index=None,
+                  server=None, planner=None, quiet=False):
+    """
+    Search subtitles for videos without one, results aren't printed
+    and nothing is downloaded.
+
+    Files are searched in batches of config['batch_size'] videos, with
+    queries for the whole batch sent in one request, and which queries
+    are sent is decided by planner. Hashing and searching is done by
+    config['jobs'] worker threads sharing one server session. Hashes
+    not in hashes are recorded in the job journal once calculated.
+
+    Args:
+        file_list: list, absolute paths of videos
+        caches: Caches of the run
+        hashes: dict with already calculated hash of file paths
+        sub_index: SubtitleIndex with already listed folders, if any
+        server: logged in OpenSubtitlesServer to use, it isn't logged
+                out afterwards. If not set a new session is started
+                once a video needs to be searched for
+        planner: QueryPlanner, by default one for
+                 config['query_strategy']
+        quiet: bool, don't print failed logins and searches of the
+               session started here
+
+    Yields:
+        tuple of Video, True if it was searched for, False if its
+        subtitle already exists or None if it couldn't be searched
+        for because login failed, and dict with seconds spent on its
+        hash and search of its batch, in order of file_list. Videos
+        that can't be read, e.g. deleted after scanning, are yielded
+        as tuple of file path, the OSError and timings.
+    """
+    own_server = server is None
+    server_lock = threading.Lock()
+    hashes = hashes or {}
+    sub_index = sub_index or SubtitleIndex(config['sub_ext'])
+    planner = planner or QueryPlanner(config['query_strategy'],
+                                      config['cutoff'])
+    default_pool.configure(size=config['pool_size'],
+                           timeout=config['timeout'])
+    default_limiter.configure(rate=config['rate_limit'],
+                              burst=config['rate_burst'])
+
+    def connect():
+        nonlocal server
+        with server_lock:
+            if not server:
+                server = OpenSubtitlesServer(config['server'],
+                                             config['ua'],
+                                             config['lang'],
+                                             caches.search_cache,
+                                             quiet=quiet)
+                server.login()
+        return server if server.logged_in else None
+
+    def search(file_paths):
+        videos = []
+        for file_path in file_paths:
+            timings = {}
+            try:
+                video = Video(file_path, config, caches.hash_cache,
+                              file_hash=hashes.get(file_path),
+                              sub_index=sub_index)
+
+                if not config['overwrite'] and video.sub_exists:
+                    videos.append((video, False, timings))
+                    continue
+
+                if config['query_strategy'] != 'name-only':
+                    start = time.perf_counter()
+                    video.file_hash
+                    timings['hash'] = time.perf_counter() - start
+                    # recorded so resumed runs don't hash the video again
+                    if caches.journal and video.file_hash and \
+                            not hashes.get(file_path):
+                        caches.journal.set(file_path, JobJournal.HASHED,
+                                           video.file_hash,
+                                           file_stat=video.file_stat)
+            except OSError as err:
+                videos.append((file_path, err, timings))
+                continue
+            videos.append((video, True, timings))
+
+        pending = [video for video, searched, _ in videos
+                   if searched is True]
+        if pending:
+            if not connect():
+                return [(video, None if searched is True else searched,
+                         timings) for video, searched, timings in videos]
+
+            start = time.perf_counter()
+            planner.search(server, pending)
+            seconds = time.perf_counter() - start
+            for _, searched, timings in videos:
+                if searched is True:
+                    timings['search'] = seconds
+
+        return videos
+
+    batch_size = max(1, config['batch_size'])
+    batches = [file_list[i:i + batch_size]
+               for i in range(0, len(file_list), batch_size)]
+    results = ordered_map(search, batches, config['jobs'])
+    try:
+        for batch in results:
+            for video in batch:
+                yield video
+    finally:
+        results.close()
+        if server and own_server:
+            server.log_out()
+        default_pool.close()
+
+
+def search_subtitles(file_list, config, sub_index=None, server=None):
     """
     Searches subitles and if any are found initiates prompt and
     other functions.
 
-    Instantiates server and does login.
+    Videos are searched for by search_videos, results are printed
+    and prompted for in the order of file_list. If config['hash_jobs']
+    is larger than 1 all files are hashed before searching starts.
+    When subtitles are downloaded automatically without prompts they
+    are downloaded by config['jobs'] worker threads too, see
+    batch_result.
+
+    State of every video is recorded in the job journal, with
+    config['resume'] set videos finished by a previous run are
+    left out and hashes it stored are reused.
 
     Args:
         file_list: list, list containing absolute paths of videos
                    for which to search subtitles for
+        sub_index: SubtitleIndex with already listed folders, if any
+        server: logged in OpenSubtitlesServer to use, it isn't logged
+                out afterwards. If not set a new session is started
     """
-    server = None
+    planner = QueryPlanner(config['query_strategy'], config['cutoff'])
+    with open_caches(config) as caches:
+        journal = caches.journal
+        file_list, hashes = prepare_files(file_list, config, caches)
+        videos = search_videos(file_list, config, caches, hashes,
+                               sub_index, server, planner)
+        auto = config['auto_download'] and not config['not_found_prompt']
 
-    for count, file_path in enumerate(file_list):
+        def download(item):
+            video, searched, timings = item
+            if auto and searched is True and video.subtitles:
+                return video, searched, batch_result(video, searched,
+                                                     timings, config)
+            return video, searched, None
 
-        video = Video(file_path, config)
+        results = ordered_map(download, videos,
+                              config['jobs'] if auto else 1)
+        try:
+            for count, (video, searched, result) in enumerate(results):
+                unreadable = isinstance(searched, OSError)
+                file_name = os.path.basename(video) if unreadable \
+                    else video.file_name
 
-        print("-" * 50 + '\nSearching subtitle for '
-                         '"{}" | ({}/{})'.format(video.file_name,
-                                                 count + 1,
-                                                 len(file_list)))
+                print("-" * 50 + '\nSearching subtitle for '
+                                 '"{}" | ({}/{})'.format(file_name,
+                                                         count + 1,
+                                                         len(file_list)))
 
-        if not config['overwrite'] and video.sub_exists:
-            print("Subtitle already exists")
-            continue
+                if unreadable:
+                    print("Couldn't read {}. {}".format(video, searched))
+                    continue
 
-        if not server:
-            server = OpenSubtitlesServer(config['server'],
-                                         config['ua'],
-                                         config['lang'])
-            server.login()
+                if searched is False:
+                    print("Subtitle already exists")
+                    continue
 
-            if not server.logged_in:
-                exit()
+                if searched is None:
+                    return
+
+                if not video.subtitles:
+                    print("Couldn't find subtitles in "
+                          "{} for {}".format(config['lang_name'],
+                                             video.file_path))
+                    if journal:
+                        journal.set(video.file_path,
+                                    JobJournal.FAILED if video.search_failed
+                                    else JobJournal.NO_RESULTS,
+                                    file_stat=video.file_stat)
+                    continue
+
+                if journal:
+                    journal.set(video.file_path, JobJournal.SEARCHED,
+                                file_stat=video.file_stat)
+                if result:
+                    print_result(result)
+                    if journal:
+                        journal.set(video.file_path,
+                                    JobJournal.SKIPPED
+                                    if result.status == FileResult.EXISTS
+                                    else result.status,
+                                    file_stat=video.file_stat)
+                    continue
+
+                downloads = []
+                for language, subtitles in video.subtitle_lists():
+                    if language:
+                        if not config['overwrite'] and \
+                                video.sub_exists_in(language):
+                            print("Subtitle in {} already "
+                                  "exists".format(language))
+                            continue
+                        if not subtitles:
+                            print("Couldn't find subtitles in "
+                                  "{}".format(language))
+                            continue
+                        print("Subtitles in {}:".format(language))
+                    downloads.append(download_prompt(video,
+                                                     subtitles=subtitles))
+
+                if journal:
+                    state = JobJournal.SKIPPED
+                    if False in downloads:
+                        state = JobJournal.FAILED
+                    elif True in downloads:
+                        state = JobJournal.DOWNLOADED
+                    journal.set(video.file_path, state,
+                                file_stat=video.file_stat)
+
+            if planner.saved:
+                print("Sent {} queries, hash matches saved {} name "
+                      "queries".format(planner.sent, planner.saved))
+        except KeyboardInterrupt:
+            print("\nCancelled...")
+        finally:
+            results.close()
+            videos.close()
 
-        if video.file_search_query:
-            video.parse_response(server.query(video.file_search_query,
-                                              desc="File Based Search"))
 
-        if video.hash_search_query:
-            video.parse_response(server.query(video.hash_search_query,
-                                              desc="Hash Based Search"))
+def print_result(result):
+    """
+    Print what was done for every language of video, the same
+    messages download_prompt prints when downloading automatically
 
-        if not video.subtitles:
-            print("Couldn't find subtitles in "
-                  "{} for {}".format(config['lang_name'], file_path))
+    Args:
+        result: FileResult from batch_result
+    """
+    for language, (_, status) in result.choices.items():
+        if status == FileResult.EXISTS:
+            print("Subtitle in {} already exists".format(language))
+            continue
+        if status == FileResult.NO_RESULTS:
+            print("Couldn't find subtitles in {}".format(language))
             continue
 
-        download_prompt(video)
+        if language:
+            print("Subtitles in {}:".format(language))
+        if status == FileResult.DOWNLOADED:
+            print("Downloaded subtitle...")
+        elif status == FileResult.SKIPPED:
+            print("Can't choose best subtitle automatically.")
+        else:
+            print("Couldn't download subtitle.")
+
+
+def batch_result(video, searched, timings, config):
+    """
+    Download the best subtitle for video, in every language searched
+    for, like auto download does
+
+    Args:
+        video: Video from search_videos, or path of video that
+               couldn't be read
+        searched: bool, None or OSError, see search_videos
+        timings: dict with seconds spent on video so far
+
+    Returns:
+        FileResult of video
+    """
+    if isinstance(searched, OSError):
+        return FileResult(video, FileResult.FAILED, error=str(searched),
+                          timings=timings)
+
+    file_hash = None
+    if config['query_strategy'] != 'name-only' and searched is not False:
+        file_hash = video.file_hash
+    result = FileResult(video.file_path, file_hash=file_hash,
+                        queries=video.queries, timings=timings)
+
+    if searched is False:
+        result.status = FileResult.EXISTS
+    elif searched is None:
+        result.status = FileResult.FAILED
+        result.error = "Login to OpenSubtitles API failed"
+    elif not video.subtitles:
+        if video.search_failed:
+            result.status = FileResult.FAILED
+            result.error = "Search failed"
+        else:
+            result.status = FileResult.NO_RESULTS
+    else:
+        for language, subtitles in video.subtitle_lists():
+            if language and not config['overwrite'] and \
+                    video.sub_exists_in(language):
+                result.choose(language, None, FileResult.EXISTS)
+                continue
+            if not subtitles:
+                result.choose(language, None, FileResult.NO_RESULTS)
+                continue
+
+            best = video.best_subtitle(subtitles)
+            if not best:
+                result.choose(language, None, FileResult.SKIPPED)
+                continue
+
+            start = time.perf_counter()
+            downloaded = video.download(best.subtitle, quiet=True)
+            result.timings['download'] = (result.timings.get('download', 0)
+                                          + time.perf_counter() - start)
+            result.choose(language, best, FileResult.DOWNLOADED
+                          if downloaded else FileResult.FAILED)
+            if not downloaded:
+                result.error = "Download failed"
+    return result
+
 
-    if server:
+def run_batch(file_list, config, sub_index=None, server=None, quiet=False):
+    """
+    Search and download subtitles without any prompts, the best
+    subtitle is always chosen automatically. Nothing is read from
+    stdin and the process is never exited, failures are reported
+    in results instead, so runs can be driven by other programs.
+    Messages are still printed unless quiet is set, see write_results.
+
+    State of every video is recorded in the job journal like with
+    search_subtitles, config['resume'] is respected too.
+
+    Args:
+        file_list: list, absolute paths of videos
+        sub_index: SubtitleIndex with already listed folders, if any
+        server: logged in OpenSubtitlesServer to use, it isn't logged
+                out afterwards. If not set a new session is started
+        quiet: bool, don't print anything, e.g. when the caller
+               reports results itself
+
+    Yields:
+        FileResult for every video, in order of file_list
+    """
+    with open_caches(config, quiet) as caches:
+        journal = caches.journal
+        file_list, hashes = prepare_files(file_list, config, caches, quiet)
+        videos = search_videos(file_list, config, caches, hashes,
+                               sub_index, server, quiet=quiet)
+        # IncompleteRead and BadStatusLine aren't OSErrors
+        from http.client import HTTPException
+
+        def download(item):
+            video, searched, timings = item
+            try:
+                return video, searched, batch_result(video, searched,
+                                                     timings, config)
+            except (OSError, HTTPException) as err:
+                # e.g. video deleted while it was searched for
+                return video, err, FileResult(
+                    getattr(video, 'file_path', video), FileResult.FAILED,
+                    error=str(err), timings=timings)
+
+        # downloads run in config['jobs'] worker threads as well
+        results = ordered_map(download, videos, config['jobs'])
+        try:
+            for video, searched, result in results:
+                if journal and searched is True:
+                    journal.set(video.file_path,
+                                JobJournal.SKIPPED
+                                if result.status == FileResult.EXISTS
+                                else result.status,
+                                file_stat=video.file_stat)
+                yield result
+        finally:
+            results.close()
+            videos.close()
+
+
+def write_results(file_list, config, sub_index=None, server=None,
+                  output=None):
+    """
+    Run run_batch and write every result as one JSON line to output,
+    other messages are printed as usual, with --json main sends them
+    to stderr
+
+    Args:
+        file_list: list, absolute paths of videos
+        sub_index: SubtitleIndex with already listed folders, if any
+        server: logged in OpenSubtitlesServer to use, see run_batch
+        output: file to write results to, by default stdout
+    """
+    output = output or sys.stdout
+    try:
+        for result in run_batch(file_list, config, sub_index, server):
+            output.write(result.to_json() + "\n")
+            output.flush()
+    except KeyboardInterrupt:
+        print("\nCancelled...")
+
+
+def coordinate(file_list, root, config):
+    """
+    Partition videos into config['shards'] shards by consistent
+    hashing of config['shard_by'], see partition, and save them to
+    the shared store at config['store'] for workers, replacing the
+    previous plan. Paths are saved relative to root, so workers can
+    have the library mounted anywhere.
+
+    Args:
+        file_list: list, absolute paths of videos
+        root: str, path of scanned folder
+
+    Returns:
+        list with list of video paths for every shard, or None if
+        the store can't be opened
+    """
+    store = open_cache(SQLiteStore, config['store'])
+    if not store:
+        return None
+
+    try:
+        shards = partition(file_list, root, config['shards'],
+                           config['shard_by'])
+        for num, paths in enumerate(shards):
+            store.set('shards', str(num),
+                      [shard_key(file_path, root) for file_path in paths])
+            print("Shard {}: {} videos".format(num, len(paths)))
+        store.set('shards', 'plan', {'shards': config['shards'],
+                                     'by': config['shard_by']})
+    finally:
+        store.close()
+    return shards
+
+
+def load_shard(root, config):
+    """
+    Videos of shard config['shard'] from the plan saved by coordinate,
+    config['shards'] and config['shard_by'] are set from the plan
+
+    Args:
+        root: str, path of scanned folder on this host
+
+    Returns:
+        list of absolute paths of videos in shard that exist on this
+        host, or None if no plan was saved, shard isn't in it or store
+        can't be opened, what went wrong is printed
+    """
+    store = open_cache(SQLiteStore, config['store'])
+    if not store:
+        return None
+
+    try:
+        plan = store.get('shards', 'plan')
+        if not plan:
+            print("No shards saved in {}, run --coordinate "
+                  "first".format(config['store']))
+            return None
+        if not 0 <= config['shard'] < plan[0]['shards']:
+            print("Shard must be from 0 to {}".format(plan[0]['shards'] - 1))
+            return None
+        shard = store.get('shards', str(config['shard']))
+        if shard is None:
+            print("Plan in {} has no videos for shard {}, run --coordinate "
+                  "again".format(config['store'], config['shard']))
+            return None
+        config['shards'] = plan[0]['shards']
+        config['shard_by'] = plan[0]['by']
+        keys = shard[0]
+    finally:
+        store.close()
+
+    file_list = [os.path.join(root, *key.split('/')) for key in keys]
+    missing = [file_path for file_path in file_list
+               if not os.path.isfile(file_path)]
+    if missing:
+        print("{} videos of shard {} are missing under {}".format(
+            len(missing), config['shard'], root))
+    return [file_path for file_path in file_list
+            if file_path not in missing]
+
+
+def run_worker(file_list, root, config, output=None):
+    """
+    Search and download subtitles for videos of one shard without
+    any prompts, see run_batch. Videos are hashed locally, search
+    results and the request budget are shared with other workers
+    through the store at config['store'], see open_caches.
+
+    Result of every video is saved to the store under 'results',
+    keyed by its path relative to root.
+
+    Args:
+        file_list: list, absolute paths of videos in the shard
+        root: str, path of scanned folder
+        output: file to write results to as JSON lines, if not set
+                status of every video is printed
+    """
+    store = open_cache(SQLiteStore, config['store'])
+    if not store:
+        return
+
+    print("Shard {} of {}: {} videos".format(config['shard'],
+                                             config['shards'],
+                                             len(file_list)))
+    try:
+        for result in run_batch(file_list, config):
+            store.set('results', shard_key(result.path, root),
+                      result.as_dict())
+            if output:
+                output.write(result.to_json() + "\n")
+                output.flush()
+            else:
+                print("{}: {}".format(result.status, result.path))
+    except KeyboardInterrupt:
+        print("\nCancelled...")
+    finally:
+        store.close()
+
+
+def watch_folder(folder, config, recursive=False, output=None):
+    """
+    Wait for videos added to folder and download subtitles for them
+    automatically, until interrupted. Videos are searched once they
+    stop growing, see Watcher, using one server session kept alive
+    between searches.
+
+    Args:
+        folder: str, path of folder to watch
+        recursive: bool, watch subfolders too
+        output: file to write JSON results to, see write_results,
+                if not set results are printed
+    """
+    watcher = Watcher(config['file_ext'], settle=config['watch_settle'],
+                      interval=config['watch_interval'],
+                      recursive=recursive)
+    watcher.add(folder)
+    server = OpenSubtitlesServer(config['server'], config['ua'],
+                                 config['lang'])
+    print("Watching {} for new videos...".format(folder))
+    try:
+        for file_list in watcher.watch():
+            if not server.keep_alive():
+                print("Will search again for {} videos "
+                      "later".format(len(file_list)))
+                watcher.retry(file_list)
+                continue
+            if output:
+                write_results(file_list, config, server=server,
+                              output=output)
+            else:
+                search_subtitles(file_list, config, server=server)
+            write_metrics(config)
+    except KeyboardInterrupt:
+        print("\nStopped watching...")
+    finally:
+        watcher.close()
         server.log_out()
 
 
+def write_metrics(config):
+    """
+    Write counters and timers of the run to config['metrics_file'],
+    as JSON if it ends with .json, otherwise in Prometheus text format
+
+    Args:
+        config: dict, run configuration
+    """
+    if not config['metrics_file']:
+        return
+    try:
+        default_metrics.write(config['metrics_file'])
+    except OSError as err:
+        print("Can't write metrics to {}. {}".format(config['metrics_file'],
+                                                     err))
+
+
+def write_profile(profiler, path):
+    """
+    Stop profiler and save its statistics
+
+    Args:
+        profiler: cProfile.Profile instance
+        path: str, file to save statistics to, readable with pstats
+    """
+    profiler.disable()
+    profiler.dump_stats(path)
+    print("Profile saved to {}, view it with "
+          "python -m pstats {}".format(path, path))
+
+
 # noinspection PyTypeChecker
-def download_prompt(video, force=False):
+def download_prompt(video, force=False, subtitles=None):
     """
     List all found subtitles from video object and
     ask user to chose which subtitle to download.
@@ -96,26 +921,36 @@ def download_prompt(video, force=False):
     Args:
         video: Video class instance with at leas one item
                in subtitles attribute
+        subtitles: SubtitleList to choose from instead of all video
+                   subtitles, e.g. ones in one language
 
+    Returns:
+        True if subtitle was downloaded, False if download failed,
+        None if no subtitle was chosen
     """
+    if subtitles is None:
+        subtitles = video.subtitles
+
     if config['auto_download'] and not force:
-        if not video.auto_download():
+        downloaded = video.auto_download(subtitles)
+        if downloaded is None:
             print("Can't choose best subtitle automatically.")
             if config['not_found_prompt']:
-                download_prompt(video, force=True)
-        return
+                return download_prompt(video, force=True,
+                                       subtitles=subtitles)
+        return downloaded
 
     user_choice = None
-    possible_choices = ["a", "q", "s", ""] + range(len(video.subtitles))
+    possible_choices = ["a", "q", "s", ""] + list(range(len(subtitles)))
 
     print("{:<2}: {:^10} {:<} {}\n{}".format("#", "Downloads", "Subtitle Name",
                                              " * - Sync subtitle", "-" * 50))
 
-    for num, subtitle in enumerate(video.subtitles):
+    for num, subtitle in enumerate(subtitles):
         print("{:<2}: {:^10} {:<}".format(num,
                                           str(subtitle.download_count) +
                                           ['', '*'][subtitle.synced],
-                                          subtitle.sub_filename.encode('utf-8')))
+                                          subtitle.sub_filename))
 
     while user_choice not in possible_choices:
         user_input = input("return - download first, 's' - skip, "
@@ -129,17 +964,20 @@ def download_prompt(video, force=False):
 
     if type(user_choice) is int:
         try:
-            video.subtitles[user_choice].download()
+            return video.download(subtitles[user_choice])
         except IndexError:
             print("Invalid input only subtitle choices "
                   "from {} to {} are available".format(0,
-                                                       len(video.subtitles)))
+                                                       len(subtitles)))
 
     elif user_choice.lower() == "a":
-        if not video.auto_download():
+        downloaded = video.auto_download(subtitles)
+        if downloaded is None:
             print("Can't choose best subtitle automatically.")
             if config['not_found_prompt']:
-                download_prompt(video, force=True)
+                return download_prompt(video, force=True,
+                                       subtitles=subtitles)
+        return downloaded
 
     elif user_choice.lower() == "q":
         print('Quitting')
@@ -149,7 +987,7 @@ def download_prompt(video, force=False):
         print("skipping...")
 
     elif user_choice == "":
-        video.subtitles[0].download()
+        return video.download(subtitles[0])
 
     else:
         print("Invalid input")
@@ -161,6 +999,7 @@ def main():
     get valid files and call search_subtitles function
     """
     valid_files = []
+    sub_index = None
     parser = argparse.ArgumentParser(description='Subtitle downloader for TV Shows')
 
     parser.add_argument("folder", type=str,
@@ -174,7 +1013,10 @@ def main():
 
     parser.add_argument("-l", "--language", type=str,
                         help="Subtitle language, must be an ISO 639-2 Code "
-                             "i.e. (eng,fre,deu) Default English(eng)")
+                             "i.e. (eng,fre,deu) Default English(eng). "
+                             "Separate languages with commas to search "
+                             "for all of them, subtitles are then saved "
+                             "as video.mkv.eng.srt")
 
     parser.add_argument("-a", "--auto", action="store_true",
                         help="Auto download subtitles for all files "
@@ -191,32 +1033,160 @@ def main():
     parser.add_argument("-r", "--recursive", action="store_true",
                         help="Search files recursively")
 
+    parser.add_argument("-u", "--skip-unchanged", action="store_true",
+                        help="Skip folders that haven't changed since "
+                             "all their videos got subtitles")
+
     parser.add_argument("-p", "--nfprompt", action="store_true",
                         help="Prompt which subtitle to download if auto"
                              "downloader can't choose one")
 
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Number of videos to hash and search for "
+                             "at the same time. Default 1")
+
+    parser.add_argument("-b", "--batch", type=int,
+                        help="Number of videos to search for with a single "
+                             "request to the server. Default 10")
+
+    parser.add_argument("--hash-jobs", type=int,
+                        help="Hash all files before searching, this many "
+                             "at the same time")
+
+    parser.add_argument("--refresh", action="store_true",
+                        help="Search again for videos searched recently, "
+                             "instead of using stored results")
+
+    parser.add_argument("-q", "--queries", choices=QueryPlanner.strategies,
+                        help="Which searches to run: both name and hash "
+                             "based, hash first and name based only if "
+                             "hash doesn't find a good match, or name "
+                             "based only. Default both")
+
+    parser.add_argument("--resume", action="store_true",
+                        help="Leave out videos handled by the previous "
+                             "run, continuing an interrupted one")
+
+    parser.add_argument("-w", "--watch", action="store_true",
+                        help="Keep running and download subtitles for "
+                             "videos added to the folder, implies -a")
+
+    parser.add_argument("--rate", type=float,
+                        help="Maximum number of requests to the server "
+                             "per second, 0 for no limit. Default 4")
+
+    parser.add_argument("--metrics", type=str, metavar="FILE",
+                        help="Save counters and timings of the run to "
+                             "FILE, as JSON if it ends with .json, "
+                             "otherwise in Prometheus text format")
+
+    parser.add_argument("--profile", type=str, metavar="FILE",
+                        help="Profile the run with cProfile and save "
+                             "statistics to FILE. Only the main thread "
+                             "is profiled, use -j 1 to include searches")
+
+    parser.add_argument("--store", type=str, metavar="FILE",
+                        help="Shared SQLite store, e.g. on a network "
+                             "share, keeping search results, the request "
+                             "budget and shards of everyone using it. "
+                             "--rate is then the budget of all of them "
+                             "together")
+
+    parser.add_argument("--coordinate", action="store_true",
+                        help="Split videos in folder into --shards "
+                             "shards and save them to --store for "
+                             "workers, nothing is searched for")
+
+    parser.add_argument("--shards", type=int,
+                        help="Number of shards videos are split into. "
+                             "Default 1")
+
+    parser.add_argument("--shard", type=int, metavar="NUM",
+                        help="Work on shard NUM, from 0, saved to --store "
+                             "by --coordinate. Implies -a")
+
+    parser.add_argument("--shard-by", choices=SHARD_BY,
+                        help="Split videos by their path, or keep videos "
+                             "of the same folder in one shard. "
+                             "Default path")
+
+    parser.add_argument("--json", action="store_true",
+                        help="Don't prompt, download the best subtitle "
+                             "and print one JSON line with the result "
+                             "for every video to stdout, other messages "
+                             "are printed to stderr")
+
     parser.add_argument('-V', '--version',
                         action='version',
                         version='%(prog)s (version {})'.format(__version__))
     args = parser.parse_args()
 
+    output = None
+    if args.json:
+        # only results are written to stdout
+        output = sys.stdout
+        sys.stdout = sys.stderr
+
+    # registered first so the profile is saved after metrics are written
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        atexit.register(write_profile, profiler, args.profile)
+        profiler.enable()
+
+    if args.metrics:
+        config['metrics_file'] = args.metrics
+    atexit.register(write_metrics, config)
+
     if args.format:
         config['file_ext'] += args.format.split(',')
 
+    if args.skip_unchanged:
+        config['skip_unchanged'] = True
+
+    if args.store:
+        config['store'] = os.path.abspath(args.store)
+
+    if args.shards:
+        config['shards'] = args.shards
+
+    if args.shard_by:
+        config['shard_by'] = args.shard_by
+
+    if args.shard is not None:
+        config['shard'] = args.shard
+
     directory = args.folder
-    if os.path.isfile(directory):
+    planned = None
+    directory_cache = None
+    if args.coordinate or config['shard'] is not None:
+        if not config['store'] or not os.path.isdir(directory):
+            print("Sharded runs need --store and a folder")
+            exit()
+        if args.watch:
+            print("Sharded runs can't watch folders")
+            exit()
+        if not args.coordinate:
+            planned = load_shard(directory, config)
+            if planned is None:
+                exit()
+
+    if planned is not None:
+        valid_files = planned
+    elif os.path.isfile(directory):
         valid_files = [directory]
     elif os.path.isdir(directory):
-        directory += os.sep if not directory.endswith(os.sep) else ""
-        valid_files = []
-        if args.recursive:
-            for root, _, files in os.walk(directory):
-                for file in files:
-                    if os.path.splitext(file)[1] in config['file_ext']:
-                        valid_files.append("{}{}{}".format(root, os.sep, file))
-        else:
-            valid_files = [directory + name for name in os.listdir(directory)
-                           if os.path.splitext(name)[1] in config['file_ext']]
+        if config['skip_unchanged']:
+            directory_cache = open_cache(DirectoryCache,
+                                         directory_cache_file)
+
+        scanner = Scanner(config['file_ext'], config['sub_ext'],
+                          directory_cache)
+        valid_files = scanner.scan(directory, args.recursive)
+        sub_index = SubtitleIndex(config['sub_ext'], scanner.subtitles)
+
+        if directory_cache:
+            print("Skipped {} unchanged folders".format(scanner.skipped))
     else:
         print("{} is not a valid file or directory".format(directory))
         exit()
@@ -226,18 +1196,27 @@ def main():
         config['subfolder'] = config['subfolder'].replace(os.sep, "")
 
     if args.language:
-        if len(args.language) == 3:
-            config['lang'] = args.language.lower()
-        elif len(args.language) > 3:
-            config['lang'] = config['languages'].get(args.language.title())
-            if not config['lang']:
-                raise ValueError("Wrong language value")
-            config['lang_name'] = args.language.title()
-        else:
-            print(
-                'Argument not ISO 639-2 Code check this for list of valid '
-                'codes http://en.wikipedia.org/wiki/List_of_ISO_639-2_codes')
-            exit()
+        codes = []
+        names = []
+        for language in args.language.split(','):
+            language = language.strip()
+            if len(language) == 3:
+                codes.append(language.lower())
+                names.append(language.lower())
+            elif len(language) > 3:
+                code = config['languages'].get(language.title())
+                if not code:
+                    raise ValueError("Wrong language value")
+                codes.append(code)
+                names.append(language.title())
+            else:
+                print(
+                    'Argument not ISO 639-2 Code check this for list of '
+                    'valid codes '
+                    'http://en.wikipedia.org/wiki/List_of_ISO_639-2_codes')
+                exit()
+        config['lang'] = ",".join(codes)
+        config['lang_name'] = ", ".join(names)
 
     if args.auto:
         config['auto_download'] = True
@@ -248,7 +1227,51 @@ def main():
     if args.nfprompt:
         config['not_found_prompt'] = True
 
-    search_subtitles(valid_files, config)
+    if args.jobs:
+        config['jobs'] = args.jobs
+
+    if args.batch:
+        config['batch_size'] = args.batch
+
+    if args.hash_jobs:
+        config['hash_jobs'] = args.hash_jobs
+
+    if args.refresh:
+        config['refresh'] = True
+
+    if args.queries:
+        config['query_strategy'] = args.queries
+
+    if args.resume:
+        config['resume'] = True
+
+    if args.rate is not None:
+        config['rate_limit'] = args.rate
+
+    if args.watch:
+        if not os.path.isdir(directory):
+            print("Only directories can be watched")
+            exit()
+        config['auto_download'] = True
+
+    if args.coordinate:
+        coordinate(valid_files, directory, config)
+    elif config['shard'] is not None:
+        run_worker(valid_files, directory, config, output)
+    elif output:
+        write_results(valid_files, config, sub_index, output=output)
+    else:
+        search_subtitles(valid_files, config, sub_index)
+
+    if directory_cache:
+        # folders are skipped later only once all their videos have
+        # subtitles, not if the run was interrupted or found nothing
+        scanner.commit(lambda file_path: has_subtitles(file_path, config,
+                                                       sub_index))
+        directory_cache.close()
+
+    if args.watch:
+        watch_folder(directory, config, args.recursive, output)
 
 
 if __name__ == '__main__':
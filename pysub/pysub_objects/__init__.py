@@ -5,6 +5,20 @@ __author__ = 'Nikola Kovacevic'
 __email__ = 'nikolak@outlook.com'
 __version__ = '0.4.0'
 
-from .subtitle import Subtitle
-from .open_subtitles import OpenSubtitlesServer
+from .cache import (HashCache, DirectoryCache, SearchCache, ParseCache,
+                    JobJournal)
+from .parsing import guess_episode_info, use_parse_cache
+from .hashing import hash_file, hash_files
+from .metrics import Metrics, default_metrics
+from .ratelimit import RateLimiter, default_limiter
+from .transport import ConnectionPool, HTTPError, default_pool
+from .subtitle import Subtitle, SubtitleList
+from .open_subtitles import OpenSubtitlesServer, AsyncOpenSubtitlesServer
+from .ranking import Ranker, Candidate
+from .planner import QueryPlanner
 from .video import Video
+from .scanner import Scanner, SubtitleIndex
+from .watcher import Watcher
+from .result import FileResult
+from .shard import HashRing, SHARD_BY, shard_key, partition
+from .store import SharedStore, SQLiteStore, SharedSearchCache
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+
+class SQLiteCache(object):
+    """Base class for caches stored in SQLite database
+
+    Database and its tables are created if they don't exist.
+    Connection can be shared between threads, writes are committed
+    in batches and on close.
+
+    Attributes:
+        path: str, absolute path of the database file
+        commit_every: int, number of writes kept before commit
+        schema: str, statement creating the table used by the cache
+
+    """
+    schema = None
+
+    def __init__(self, path, commit_every=100):
+        """
+        Open or create database at path.
+
+        Args:
+            path: str, absolute path of the database file
+            commit_every: int, number of writes kept before commit
+
+        Raises:
+            sqlite3.Error: if database can't be opened
+            OSError: if folder for database can't be created
+        """
+        self.path = path
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(self.schema)
+        self._db.commit()
+
+    def _fetch(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchone()
+
+    def _write(self, sql, args=()):
+        with self._lock:
+            self._db.execute(sql, args)
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_every:
+                self._db.commit()
+                self._uncommitted = 0
+
+    def close(self):
+        """
+        Commit all pending writes and close the database
+        """
+        self.clean()
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+    def clean(self):
+        """
+        Called before the database is closed, remove stale entries here
+        """
+        pass
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__, self.path)
+
+
+class HashCache(SQLiteCache):
+    """Persistent store of video file hashes
+
+    Hashes are keyed by absolute file path, size, modification
+    time and inode. If any of those change the stored hash is
+    ignored, so unchanged files are never read twice.
+
+    """
+    schema = ("CREATE TABLE IF NOT EXISTS hashes ("
+              "path TEXT PRIMARY KEY, size INTEGER, "
+              "mtime INTEGER, inode INTEGER, hash TEXT)")
+
+    @staticmethod
+    def _key(file_path, file_stat):
+        return (os.path.abspath(file_path), file_stat.st_size,
+                file_stat.st_mtime_ns, file_stat.st_ino)
+
+    def get(self, file_path, file_stat=None):
+        """
+        Get stored hash for file_path
+
+        Args:
+            file_path: str, path of video file
+            file_stat: os.stat_result for file_path, if already available
+
+        Returns:
+            String containing file hash or None if the file was
+            never hashed or has changed since
+        """
+        path, size, mtime, inode = self._key(file_path,
+                                             file_stat or os.stat(file_path))
+        row = self._fetch("SELECT size, mtime, inode, hash "
+                          "FROM hashes WHERE path = ?", (path,))
+        if row and tuple(row[:3]) == (size, mtime, inode):
+            return row[3]
+        return None
+
+    def set(self, file_path, file_hash, file_stat=None):
+        """
+        Store hash for file_path
+
+        Args:
+            file_path: str, path of video file
+            file_hash: str, hash of the file
+            file_stat: os.stat_result for file_path, if already available
+        """
+        key = self._key(file_path, file_stat or os.stat(file_path))
+        self._write("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+                    key + (file_hash,))
+
+
+class DirectoryCache(SQLiteCache):
+    """Persistent store of scanned directories
+
+    Keeps modification time and list of subdirectories for every
+    scanned directory, so directories that haven't changed since
+    the last scan don't have to be listed again.
+
+    """
+    schema = ("CREATE TABLE IF NOT EXISTS directories ("
+              "path TEXT PRIMARY KEY, mtime INTEGER, subdirs TEXT)")
+
+    def get(self, path):
+        """
+        Get stored information for directory at path
+
+        Args:
+            path: str, path of directory
+
+        Returns:
+            Tuple of modification time in nanoseconds and list of
+            subdirectory paths, or None if it was never scanned
+        """
+        row = self._fetch("SELECT mtime, subdirs FROM directories "
+                          "WHERE path = ?", (os.path.abspath(path),))
+        if row:
+            return row[0], json.loads(row[1])
+        return None
+
+    def set(self, path, mtime, subdirs):
+        """
+        Store information for directory at path
+
+        Args:
+            path: str, path of directory
+            mtime: int, modification time of directory in nanoseconds
+            subdirs: list of subdirectory paths
+        """
+        self._write("INSERT OR REPLACE INTO directories VALUES (?, ?, ?)",
+                    (os.path.abspath(path), mtime, json.dumps(subdirs)))
+
+
+class SearchCache(SQLiteCache):
+    """Persistent store of search results
+
+    Subtitles found by every query are stored with the time of the
+    search. Results are used until they are older than ttl, or
+    negative_ttl if nothing was found. Only max_entries most recently
+    used queries are kept, older ones are removed every clean_every
+    stored results and when the cache is closed, so long runs don't
+    grow it without bound.
+
+    Attributes:
+        ttl: int, seconds for which found subtitles are used
+        negative_ttl: int, seconds for which empty results are used
+        max_entries: int, number of queries kept
+        clean_every: int, number of stored results between removals
+        refresh: bool, ignore stored results, new ones are still stored
+
+    """
+    schema = ("CREATE TABLE IF NOT EXISTS searches ("
+              "query TEXT PRIMARY KEY, data TEXT, "
+              "searched REAL, used REAL)")
+
+    def __init__(self, path, ttl=7 * 86400, negative_ttl=86400,
+                 max_entries=100000, refresh=False, clean_every=1000):
+        """
+        Args:
+            path: str, absolute path of the database file
+            ttl: int, seconds for which found subtitles are used
+            negative_ttl: int, seconds for which empty results are used
+            max_entries: int, number of queries kept
+            refresh: bool, ignore stored results
+            clean_every: int, number of stored results between removals
+        """
+        super(SearchCache, self).__init__(path)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self.clean_every = clean_every
+        self._stored = 0
+
+    @staticmethod
+    def _key(query):
+        return json.dumps(sorted((field, str(value).lower())
+                                 for field, value in query.items()))
+
+    def get(self, query):
+        """
+        Get stored result of query
+
+        Args:
+            query: dict containing query fields
+
+        Returns:
+            list of subtitle dicts found by query, or None if query
+            wasn't stored, has expired or refresh is set
+        """
+        if self.refresh:
+            return None
+
+        key = self._key(query)
+        row = self._fetch("SELECT data, searched FROM searches "
+                          "WHERE query = ?", (key,))
+        if not row:
+            return None
+
+        data = json.loads(row[0])
+        ttl = self.ttl if data else self.negative_ttl
+        if time.time() - row[1] > ttl:
+            return None
+
+        self._write("UPDATE searches SET used = ? WHERE query = ?",
+                    (time.time(), key))
+        return data
+
+    def set(self, query, data):
+        """
+        Store result of query
+
+        Args:
+            query: dict containing query fields
+            data: list of subtitle dicts found by query
+        """
+        now = time.time()
+        self._write("INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?)",
+                    (self._key(query), json.dumps(data), now, now))
+        with self._lock:
+            self._stored += 1
+            due = self._stored >= self.clean_every
+            if due:
+                self._stored = 0
+        if due:
+            self.clean()
+
+    def clean(self):
+        """
+        Remove all but max_entries most recently used queries
+        """
+        self._write("DELETE FROM searches WHERE query NOT IN ("
+                    "SELECT query FROM searches "
+                    "ORDER BY used DESC, rowid DESC LIMIT ?)",
+                    (self.max_entries,))
+
+
+class ParseCache(SQLiteCache):
+    """Persistent store of guessit results
+
+    Results are keyed by the parsed file name and guessit version,
+    so upgrading guessit doesn't reuse results of the old one.
+
+    """
+    schema = ("CREATE TABLE IF NOT EXISTS guesses ("
+              "name TEXT, version TEXT, info TEXT, "
+              "PRIMARY KEY (name, version))")
+
+    def get(self, name, version):
+        """
+        Get stored guessit result for name
+
+        Args:
+            name: str, file name or path that was parsed
+            version: str, guessit version
+
+        Returns:
+            dict with parsed information or None if not stored
+        """
+        row = self._fetch("SELECT info FROM guesses "
+                          "WHERE name = ? AND version = ?", (name, version))
+        if row:
+            return json.loads(row[0])
+        return None
+
+    def set(self, name, version, info):
+        """
+        Store guessit result for name, values that can't be
+        stored as json are stored as strings
+
+        Args:
+            name: str, file name or path that was parsed
+            version: str, guessit version
+            info: dict with parsed information
+        """
+        self._write("INSERT OR REPLACE INTO guesses VALUES (?, ?, ?)",
+                    (name, version, json.dumps(dict(info), default=str)))
+
+
+class JobJournal(SQLiteCache):
+    """Persistent record of what was done for every video
+
+    State of every video is stored as it changes, keyed like
+    HashCache so a changed file is handled again, and by the set of
+    languages searched for, so searching in other languages doesn't
+    reuse states of earlier runs. File hashes are shared by all
+    language sets. Writes are committed in batches, so a run that
+    dies loses at most the last commit_every states. Entries older
+    than ttl are removed.
+
+    States:
+        hashed: file was hashed, hash is stored with the state
+        searched: subtitles were found, nothing was downloaded yet
+        no-results: no subtitles were found
+        downloaded: subtitle was downloaded
+        failed: search or download failed
+        skipped: user chose not to download any subtitle
+
+    Attributes:
+        ttl: int, seconds for which states are kept
+        languages: str, sorted language codes states are kept for
+
+    """
+    HASHED = 'hashed'
+    SEARCHED = 'searched'
+    NO_RESULTS = 'no-results'
+    DOWNLOADED = 'downloaded'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+
+    # videos in these states aren't handled again by resumed runs
+    finished_states = (NO_RESULTS, DOWNLOADED, SKIPPED)
+
+    schema = ("CREATE TABLE IF NOT EXISTS job_states ("
+              "path TEXT, languages TEXT, size INTEGER, mtime INTEGER, "
+              "inode INTEGER, state TEXT, hash TEXT, updated REAL, "
+              "PRIMARY KEY (path, languages))")
+
+    def __init__(self, path, ttl=30 * 86400, commit_every=50, languages=''):
+        """
+        Args:
+            path: str, absolute path of the database file
+            ttl: int, seconds for which states are kept
+            commit_every: int, number of writes kept before commit
+            languages: str, comma separated language codes searched for
+        """
+        super(JobJournal, self).__init__(path, commit_every)
+        self.ttl = ttl
+        self.languages = ",".join(sorted(set(
+            language.strip() for language in languages.split(',')
+            if language.strip())))
+
+    def get(self, file_path, file_stat=None):
+        """
+        Get stored state of video at file_path
+
+        Args:
+            file_path: str, path of video file
+            file_stat: os.stat_result for file_path, if already available
+
+        Returns:
+            Tuple of state, None if video has no state for languages,
+            and file hash, which may be None, or None if the file has
+            neither or has changed since
+        """
+        key = HashCache._key(file_path, file_stat or os.stat(file_path))
+        state = self._fetch("SELECT state FROM job_states WHERE path = ? "
+                            "AND languages = ? AND size = ? AND mtime = ? "
+                            "AND inode = ?",
+                            (key[0], self.languages) + key[1:])
+        file_hash = self._fetch("SELECT hash FROM job_states WHERE path = ? "
+                                "AND size = ? AND mtime = ? AND inode = ? "
+                                "AND hash IS NOT NULL", key)
+        if state or file_hash:
+            return state and state[0], file_hash and file_hash[0]
+        return None
+
+    def set(self, file_path, state, file_hash=None, file_stat=None):
+        """
+        Store state of video at file_path, already stored hash
+        is kept if file_hash isn't set
+
+        Args:
+            file_path: str, path of video file
+            state: str, one of JobJournal states
+            file_hash: str, hash of the file
+            file_stat: os.stat_result for file_path, if already available
+        """
+        key = HashCache._key(file_path, file_stat or os.stat(file_path))
+        self._write("INSERT OR REPLACE INTO job_states VALUES "
+                    "(?, ?, ?, ?, ?, ?, COALESCE(?, (SELECT hash FROM "
+                    "job_states WHERE path = ? AND size = ? AND mtime = ? "
+                    "AND inode = ? AND hash IS NOT NULL)), ?)",
+                    (key[0], self.languages) + key[1:] + (state, file_hash)
+                    + key + (time.time(),))
+
+    def finished(self, file_path):
+        """
+        Check if video at file_path was handled by a previous run
+        searching for the same languages
+
+        Args:
+            file_path: str, path of video file
+
+        Returns:
+            True if the file is unchanged and its state is one of
+            finished_states, False otherwise
+        """
+        try:
+            stored = self.get(file_path)
+        except OSError:
+            return False
+        return bool(stored) and stored[0] in self.finished_states
+
+    def clean(self):
+        """
+        Remove states older than ttl
+        """
+        self._write("DELETE FROM job_states WHERE updated < ?",
+                    (time.time() - self.ttl,))
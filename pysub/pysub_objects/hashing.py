@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+OpenSubtitles hash of video files
+
+Hash is file size plus the sum of all 64bit little endian integers
+in the first and the last 64kb of the file, truncated to 64bits.
+"""
+
+import os
+import struct
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .metrics import default_metrics
+
+CHUNK_SIZE = 65536
+_chunk_format = struct.Struct("<{}Q".format(CHUNK_SIZE // 8))
+
+
+def hash_file(file_path, file_size=None):
+    """
+    Calculates hash for video file if the file is larger than 128kb.
+    Beginning and end of the file are read with one call each.
+
+    Args:
+        file_path: str, path of video file
+        file_size: int, size of file in bytes if already known
+
+    Returns:
+        String containing file hash or None if the file
+        is not found or is too small (<128kb)
+    """
+    with default_metrics.timer('hash'):
+        file_hash = _read_hash(file_path, file_size)
+    if file_hash:
+        default_metrics.count('hash_bytes', CHUNK_SIZE * 2)
+    return file_hash
+
+
+def _read_hash(file_path, file_size):
+    try:
+        if file_size is None:
+            file_size = os.path.getsize(file_path)
+        if file_size < CHUNK_SIZE * 2:
+            return None
+
+        buffer = bytearray(CHUNK_SIZE)
+        file_hash = file_size
+
+        with open(file_path, "rb") as in_file:
+            for offset in (0, file_size - CHUNK_SIZE):
+                in_file.seek(offset)
+                if in_file.readinto(buffer) != CHUNK_SIZE:
+                    return None
+                file_hash += sum(_chunk_format.unpack(buffer))
+
+        return "%016x" % (file_hash & 0xFFFFFFFFFFFFFFFF)
+
+    except IOError:
+        return None
+
+
+def hash_files(file_paths, jobs=1, per_device=None, processes=False):
+    """
+    Calculates hashes for multiple files, using a pool of workers
+    if jobs is larger than 1. Files are grouped by the device they
+    are on and at most per_device of them are read from the same
+    device at once, so a single disk isn't thrashed by seeks.
+
+    Args:
+        file_paths: iterable of video file paths
+        jobs: int, number of files hashed at the same time
+        per_device: int, number of files hashed at the same time
+                    from one device, defaults to jobs
+        processes: bool, use processes instead of threads for workers
+
+    Returns:
+        dict with file path as key and hash, or None, as value
+        in the same order as file_paths
+    """
+    file_paths = list(file_paths)
+    if jobs <= 1:
+        return {file_path: hash_file(file_path) for file_path in file_paths}
+
+    devices = collections.OrderedDict()
+    for file_path in file_paths:
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            devices.setdefault(None, collections.deque()).append(
+                (file_path, None))
+            continue
+        devices.setdefault(file_stat.st_dev, collections.deque()).append(
+            (file_path, file_stat.st_size))
+
+    hashes = {}
+    running = {}
+    executor_class = ThreadPoolExecutor
+    if processes:
+        # multiprocessing is slow to import and rarely used
+        from concurrent.futures import ProcessPoolExecutor
+        executor_class = ProcessPoolExecutor
+
+    with executor_class(max_workers=jobs) as executor:
+
+        def submit(device):
+            file_path, file_size = devices[device].popleft()
+            future = executor.submit(hash_file, file_path, file_size)
+            running[future] = file_path, device
+
+        for device, queue in devices.items():
+            for _ in range(min(per_device or jobs, len(queue))):
+                submit(device)
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_path, device = running.pop(future)
+                hashes[file_path] = future.result()
+                if devices[device]:
+                    submit(device)
+
+    return {file_path: hashes[file_path] for file_path in file_paths}
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+import bisect
+import threading
+import contextlib
+import collections
+
+
+class Timer(object):
+    """Number, total and histogram of durations of one operation
+
+    Attributes:
+        count: int, number of observed durations
+        total: float, sum of observed durations in seconds
+        buckets: list of counts of durations up to every bound
+                 of Metrics.buckets, and one more for longer ones
+
+    """
+    __slots__ = ('count', 'total', 'buckets')
+
+    def __init__(self, bounds):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(bounds) + 1)
+
+
+class Metrics(object):
+    """Counters and timers of one run
+
+    Counters count events or bytes, e.g. cache hits or downloaded
+    bytes, timers keep latency histograms of operations. Both are
+    named with lower case words joined by underscores, and can be
+    exported as JSON or as Prometheus text format.
+
+    Attributes:
+        buckets: tuple of histogram upper bounds in seconds
+        started: float, time.time() when metrics were reset
+
+    """
+    buckets = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0,
+               2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clear all counters and timers
+        """
+        with self._lock:
+            self.started = time.time()
+            self._counters = collections.Counter()
+            self._timers = {}
+
+    def count(self, name, value=1):
+        """
+        Add value to counter
+
+        Args:
+            name: str, counter name, e.g. 'hash_cache_hits'
+            value: int, number added to the counter
+        """
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name, seconds):
+        """
+        Record duration of operation
+
+        Args:
+            name: str, timer name, e.g. 'download'
+            seconds: float, duration of operation
+        """
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = Timer(self.buckets)
+            timer.count += 1
+            timer.total += seconds
+            timer.buckets[bisect.bisect_left(self.buckets, seconds)] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        Time the with block, also when it raises
+
+        Args:
+            name: str, timer name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def summary(self):
+        """
+        All counters and timers
+
+        Returns:
+            dict with run start and duration, counters and timers,
+            for every timer its count, total and mean seconds and
+            cumulative histogram keyed by upper bound
+        """
+        with self._lock:
+            counters = collections.OrderedDict(sorted(self._counters.items()))
+            timers = collections.OrderedDict()
+            for name, timer in sorted(self._timers.items()):
+                cumulative = 0
+                histogram = collections.OrderedDict()
+                for bound, count in zip(self.buckets + ('+Inf',),
+                                        timer.buckets):
+                    cumulative += count
+                    histogram[str(bound)] = cumulative
+                timers[name] = {'count': timer.count,
+                                'seconds': timer.total,
+                                'mean': timer.total / timer.count,
+                                'histogram': histogram}
+
+        return {'started': self.started,
+                'duration': time.time() - self.started,
+                'counters': counters,
+                'timers': timers}
+
+    def to_json(self):
+        """
+        Returns:
+            str, summary as JSON
+        """
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self, prefix="pysub"):
+        """
+        Summary in Prometheus text exposition format, counters are
+        exported as counters and timers as histograms
+
+        Args:
+            prefix: str, prefix of every metric name
+
+        Returns:
+            str, metrics text
+        """
+        summary = self.summary()
+        lines = []
+        for name, value in summary['counters'].items():
+            metric = "{}_{}_total".format(prefix, name)
+            lines.append("# TYPE {} counter".format(metric))
+            lines.append("{} {}".format(metric, value))
+
+        for name, timer in summary['timers'].items():
+            metric = "{}_{}_seconds".format(prefix, name)
+            lines.append("# TYPE {} histogram".format(metric))
+            for bound, count in timer['histogram'].items():
+                lines.append('{}_bucket{{le="{}"}} {}'.format(
+                    metric, bound, count))
+            lines.append("{}_sum {}".format(metric, timer['seconds']))
+            lines.append("{}_count {}".format(metric, timer['count']))
+
+        metric = "{}_run_duration_seconds".format(prefix)
+        lines.append("# TYPE {} gauge".format(metric))
+        lines.append("{} {}".format(metric, summary['duration']))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Write metrics to file, as JSON if path ends with .json and in
+        Prometheus text format otherwise. File is replaced at once,
+        so collectors reading it never see a partial file.
+
+        Args:
+            path: str, path of metrics file
+
+        Raises:
+            OSError: if file can't be written
+        """
+        if path.lower().endswith(".json"):
+            text = self.to_json()
+        else:
+            text = self.to_prometheus()
+
+        temp_path = "{}.tmp".format(path)
+        with open(temp_path, "w") as metrics_file:
+            metrics_file.write(text)
+        os.replace(temp_path, path)
+
+    def __repr__(self):
+        return "<Metrics {} counters {} timers>".format(len(self._counters),
+                                                        len(self._timers))
+
+
+default_metrics = Metrics()
@@ -15,8 +15,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import re
 import time
-import xmlrpc.client as xmlrpclib
+import threading
+import functools
+from urllib.parse import urlsplit
+
+from .transport import default_pool
+from .ratelimit import (THROTTLED_STATUSES, default_limiter,
+                        status_code)
+from .metrics import default_metrics
 
 
 class OpenSubtitlesServer(object):
@@ -31,12 +39,18 @@ class OpenSubtitlesServer(object):
         user_agent: str, user agent for for auth with opensubtitles server
         tokken: str, acquired after successful login and required for queries
         logged_in: bool, self set to indicate whether login was done or not
-        server: ServerProxy object
+        server: ServerProxy object, one per thread so that the same
+                session can be shared by concurrent workers
+        search_cache: SearchCache used by batch_query or None
+        pool: ConnectionPool shared by all ServerProxy instances
+        limiter: RateLimiter every call to server waits for
+        quiet: bool, don't print failed logins and queries
 
 
     """
 
-    def __init__(self, server, ua, language):
+    def __init__(self, server, ua, language, search_cache=None, pool=None,
+                 limiter=None, quiet=False):
         """
         Initialization of server instance. By default values
         are taken from CONFIG dictionary
@@ -45,13 +59,99 @@ class OpenSubtitlesServer(object):
             server: str, XMLRPC server URL
             user_agent: str, user agent for for auth with opensubtitles server
             language: str, Language used for searches ISO639-2 format
+            search_cache: SearchCache with results of previous queries
+            pool: ConnectionPool for server connections, by default
+                  the pool also used for downloading subtitles
+            limiter: RateLimiter for calls to server, by default
+                     the limiter also used for downloading subtitles
+            quiet: bool, don't print failed logins and queries
 
         """
         self.language = language
         self.user_agent = ua
         self.token = None
         self.logged_in = False
-        self.server = xmlrpclib.ServerProxy(server)
+        self.server_url = server
+        self.search_cache = search_cache
+        self.pool = pool or default_pool
+        self.limiter = limiter or default_limiter
+        self.quiet = quiet
+        self._local = threading.local()
+
+    @property
+    def server(self):
+        """
+        ServerProxy for the current thread. ServerProxy can't be used
+        from multiple threads at once, token and connection pool are
+        shared between all of them.
+
+        Returns:
+            ServerProxy instance bound to the calling thread
+        """
+        proxy = getattr(self._local, 'proxy', None)
+        if proxy is None:
+            # xmlrpc is only loaded once the server is used, runs where
+            # every video already has subtitles never import it
+            import xmlrpc.client as xmlrpclib
+            from .rpc import PooledTransport
+            transport = PooledTransport(self.pool,
+                                        urlsplit(self.server_url).scheme)
+            proxy = xmlrpclib.ServerProxy(self.server_url,
+                                          transport=transport)
+            self._local.proxy = proxy
+        return proxy
+
+    def call(self, method, *args, attempts=2, throttled_attempts=5):
+        """
+        Call XMLRPC method on server. Calls wait for rate limiter, failed
+        calls are retried after a jittered exponential delay, and calls
+        rejected because server is throttling us pause all requests.
+
+        Args:
+            method: str, name of XMLRPC method, e.g. 'SearchSubtitles'
+            args: arguments for the method
+            attempts: int, number of failed calls before giving up
+            throttled_attempts: int, number of throttled calls
+                                before giving up
+
+        Returns:
+            Server response json/dict if its status is 200 OK,
+            otherwise None
+        """
+        import http.client
+        import xmlrpc.client as xmlrpclib
+        from xml.parsers.expat import ExpatError
+
+        # e.g. SearchSubtitles is timed as api_search_subtitles
+        timer = "api" + re.sub(r'([A-Z])', r'_\1', method).lower()
+        failures = 0
+        throttles = 0
+        while failures < attempts and throttles <= throttled_attempts:
+            self.limiter.acquire()
+            try:
+                with default_metrics.timer(timer):
+                    response = getattr(self.server, method)(*args)
+                code = status_code(response.get('status'))
+            except xmlrpclib.ProtocolError as err:
+                response, code = None, err.errcode
+            except (xmlrpclib.Error, ExpatError, OSError,
+                    http.client.HTTPException, AttributeError):
+                response, code = None, None
+
+            if code == 200:
+                self.limiter.succeeded()
+                return response
+
+            if code in THROTTLED_STATUSES:
+                throttles += 1
+                self.limiter.throttled()
+                continue
+
+            failures += 1
+            default_metrics.count('api_failures')
+            if failures < attempts:
+                time.sleep(self.limiter.backoff_delay(failures - 1))
+        return None
 
     def login(self, login_attempts=3):
         """
@@ -62,26 +162,46 @@ class OpenSubtitlesServer(object):
             login_attempts: int, number of retries in case of errors
                             before giving up on logging in
         """
-        tries = login_attempts
-        session = None
-        while not session and tries > 0:
-            try:
-                session = self.server.LogIn('', '',
-                                            self.language,
-                                            self.user_agent)
-            except xmlrpclib.ProtocolError as err:
-                print("Error while logging in to API. {}".format(err.errmsg))
-                time.sleep(2)
-                tries -= 1
+        # with more than one search language, first one is used for login
+        self.start_session(self.call('LogIn', '', '',
+                                     self.language.split(',')[0],
+                                     self.user_agent,
+                                     attempts=login_attempts))
+
+    def start_session(self, session):
+        """
+        Set token from LogIn response
 
+        Args:
+            session: json/dict LogIn response, or None if it failed
+        """
         if session is None or session['status'] != '200 OK':
-            print("Login to OpenSubtitles API failed...")
+            if not self.quiet:
+                print("Login to OpenSubtitles API failed...")
         else:
             try:
                 self.token = session['token']
                 self.logged_in = True
             except KeyError:
-                print("Token not found.")
+                if not self.quiet:
+                    print("Token not found.")
+
+    def keep_alive(self):
+        """
+        Extend the session, tokens expire after some time without
+        calls. If the token has expired login again.
+
+        Returns:
+            True if logged in, False otherwise
+        """
+        if self.token:
+            if self.call('NoOperation', self.token, attempts=1):
+                return True
+            self.token = None
+            self.logged_in = False
+
+        self.login()
+        return self.logged_in
 
     def log_out(self):
         """
@@ -89,7 +209,7 @@ class OpenSubtitlesServer(object):
         Without this it's impossible to do query.
         """
         if self.token:
-            self.server.LogOut(self.token)
+            self.call('LogOut', self.token, attempts=1)
             self.token = None
             self.logged_in = False
 
@@ -107,24 +227,189 @@ class OpenSubtitlesServer(object):
             Server response, json/dict if the query was successful, otherwise
             returns None
         """
-        results = None
-        attempts_left = attempts
-        while not results and attempts_left > 0:
+        results = self.call('SearchSubtitles', self.token, query,
+                            attempts=attempts)
+        if results is None and not self.quiet:
+            print("{} failed...".format(desc))
+        return results
+
+    def batch_query(self, queries, desc="Batch search query"):
+        """
+        Execute multiple queries with one SearchSubtitles call and split
+        the response back to the query each subtitle was found by.
+
+        Server numbers every result with QueryNumber, index of the query
+        in the list. Results without it are matched to hash queries by
+        MovieHash, anything else is dropped.
+
+        Queries found in search_cache aren't sent to the server, and
+        results of the ones that are sent are stored in it.
+
+        Args:
+            queries: list of dicts containing query fields
+            desc: str, description of query displayed in case of fail
+
+        Returns:
+            List with response for every query in queries, in the same
+            order. Each response is json/dict with only the subtitles
+            for that query, or None if the query was unsuccessful.
+        """
+        responses = [None] * len(queries)
+        missing = []
+        for num, query in enumerate(queries):
+            cached = self.search_cache and self.search_cache.get(query)
+            if cached is None:
+                missing.append(num)
+            else:
+                responses[num] = {'status': '200 OK', 'data': cached}
+        default_metrics.count('queries', len(queries))
+        default_metrics.count('search_cache_hits',
+                              len(queries) - len(missing))
+
+        if not missing:
+            return responses
+
+        results = self.query([queries[num] for num in missing], desc=desc)
+        if not results:
+            return responses
+
+        hashes = {}
+        for position, num in enumerate(missing):
+            responses[num] = {'status': results['status'], 'data': []}
+            if 'moviehash' in queries[num]:
+                hashes.setdefault(queries[num]['moviehash'], position)
+
+        for subtitle_json in results.get('data') or []:
             try:
-                results = self.server.SearchSubtitles(self.token, query)
-                if results['status'] != '200 OK':
-                    results = None
-                    attempts_left -= 1
-                else:
-                    return results
-            except:
-                results = None
-                attempts_left-=1
-        print("{} failed...".format(desc))
-        return None
+                position = int(subtitle_json['QueryNumber'])
+            except (KeyError, ValueError):
+                position = hashes.get(subtitle_json.get('MovieHash'))
+
+            if position is not None and 0 <= position < len(missing):
+                responses[missing[position]]['data'].append(subtitle_json)
+
+        if self.search_cache:
+            for num in missing:
+                self.search_cache.set(queries[num], responses[num]['data'])
+
+        return responses
 
     def __repr__(self):
         """
         repr of OpenSubtitlesServer instance with current set token
         """
         return "<Server {}>".format(self.token)
+
+
+class AsyncOpenSubtitlesServer(object):
+    """asyncio counterpart of OpenSubtitlesServer
+
+    Server calls and subtitle downloads are run in executor threads
+    so they don't block the event loop, at most concurrency of them
+    at the same time. All of them share one OpenSubtitlesServer
+    session and its connection pool.
+
+    Attributes:
+        sync_server: OpenSubtitlesServer doing the actual calls
+        concurrency: int, number of calls in flight at the same time
+        executor: concurrent.futures.Executor or None for loop default
+
+    """
+
+    def __init__(self, server, ua, language, search_cache=None, pool=None,
+                 limiter=None, concurrency=4, executor=None):
+        """
+        Args:
+            server: str, XMLRPC server URL
+            user_agent: str, user agent for for auth with opensubtitles server
+            language: str, Language used for searches ISO639-2 format
+            search_cache: SearchCache with results of previous queries
+            pool: ConnectionPool for server connections and downloads
+            limiter: RateLimiter for calls to server
+            concurrency: int, number of calls in flight at the same time
+            executor: concurrent.futures.Executor to run calls in
+        """
+        self.sync_server = OpenSubtitlesServer(server, ua, language,
+                                               search_cache, pool, limiter)
+        self.concurrency = concurrency
+        self.executor = executor
+        self._semaphore = None
+
+    @property
+    def token(self):
+        return self.sync_server.token
+
+    @property
+    def logged_in(self):
+        return self.sync_server.logged_in
+
+    async def _call(self, func, *args, **kwargs):
+        import asyncio
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            # get_running_loop is new in Python 3.7
+            loop = getattr(asyncio, 'get_running_loop',
+                           asyncio.get_event_loop)()
+            return await loop.run_in_executor(
+                self.executor, functools.partial(func, *args, **kwargs))
+
+    async def login(self, login_attempts=3):
+        """
+        Login to server and aquire token, see OpenSubtitlesServer.login
+
+        Args:
+            login_attempts: int, number of retries in case of errors
+                            before giving up on logging in
+        """
+        server = self.sync_server
+        session = await self._call(server.call, 'LogIn', '', '',
+                                   server.language.split(',')[0],
+                                   server.user_agent,
+                                   attempts=login_attempts)
+        server.start_session(session)
+
+    async def log_out(self):
+        """
+        Run LogOut on server, see OpenSubtitlesServer.log_out
+        """
+        await self._call(self.sync_server.log_out)
+
+    async def query(self, query, attempts=2, desc="Search query"):
+        """
+        Execute query, see OpenSubtitlesServer.query
+
+        Returns:
+            Server response, json/dict if the query was successful, otherwise
+            returns None
+        """
+        return await self._call(self.sync_server.query, query,
+                                attempts=attempts, desc=desc)
+
+    async def batch_query(self, queries, desc="Batch search query"):
+        """
+        Execute multiple queries at once, see OpenSubtitlesServer.batch_query
+
+        Returns:
+            List with response for every query in queries
+        """
+        return await self._call(self.sync_server.batch_query, queries,
+                                desc=desc)
+
+    async def download(self, subtitle, quiet=False):
+        """
+        Download subtitle using the same connection pool as the server
+
+        Args:
+            subtitle: Subtitle instance to download
+            quiet: bool, don't print anything, see Subtitle.download
+
+        Returns:
+            True if subtitle was saved, False otherwise
+        """
+        return await self._call(subtitle.download, self.sync_server.pool,
+                                limiter=self.sync_server.limiter,
+                                quiet=quiet)
+
+    def __repr__(self):
+        return "<AsyncServer {}>".format(self.token)
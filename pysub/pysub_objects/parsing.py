@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Memoized guessit parsing
+
+Every name is parsed by guessit at most once per process, and
+at most once per guessit version if parse cache is set.
+"""
+
+import functools
+
+from .metrics import default_metrics
+
+parse_cache = None
+
+
+def use_parse_cache(cache):
+    """
+    Set persistent cache for parse results and clear memoized ones
+
+    Args:
+        cache: ParseCache instance or None to disable it
+    """
+    global parse_cache
+    parse_cache = cache
+    _guess_episode_info.cache_clear()
+
+
+@functools.lru_cache(maxsize=8192)
+def _guess_episode_info(name):
+    # guessit takes long to import, it's only loaded on first parse
+    import guessit
+    info = parse_cache and parse_cache.get(name, guessit.__version__)
+    if info is not None:
+        default_metrics.count('parse_cache_hits')
+    else:
+        with default_metrics.timer('guessit'):
+            info = dict(guessit.guess_episode_info(name))
+        if parse_cache:
+            parse_cache.set(name, guessit.__version__, info)
+    return info
+
+
+def guess_episode_info(name):
+    """
+    Parse episode information from file name or path with guessit
+
+    Args:
+        name: str, file name or path
+
+    Returns:
+        dict with information found by guessit, e.g. series,
+        season, episodeNumber, title
+    """
+    return dict(_guess_episode_info(name))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from .ranking import Ranker
+
+
+class QueryPlanner(object):
+    """Decides which queries are sent for a batch of videos
+
+    Strategies:
+        both: file (name) and hash queries for every video
+        hash-first: hash queries first, file queries only for videos
+                    without a confident synced match
+        name-only: only file queries, videos aren't hashed
+
+    Hash search match is confident if the best ranked subtitle is
+    synced and either is for the same episode as the video or its
+    title similarity is above cutoff. When more than one language is
+    searched for every language needs a confident match.
+
+    Attributes:
+        strategy: str, one of QueryPlanner.strategies
+        cutoff: float, minimum title similarity ratio
+        sent: int, number of queries sent
+        saved: int, number of file queries not sent by hash-first
+
+    """
+    strategies = ('both', 'hash-first', 'name-only')
+
+    def __init__(self, strategy='both', cutoff=0.75):
+        """
+        Args:
+            strategy: str, one of QueryPlanner.strategies
+            cutoff: float, minimum title similarity ratio
+
+        Raises:
+            ValueError: if strategy is not known
+        """
+        if strategy not in self.strategies:
+            raise ValueError("Unknown query strategy {}".format(strategy))
+        self.strategy = strategy
+        self.cutoff = cutoff
+        self.sent = 0
+        self.saved = 0
+        self._lock = threading.Lock()
+
+    def search(self, server, videos):
+        """
+        Search subtitles for videos, found subtitles are added
+        to every video with Video.parse_response
+
+        Args:
+            server: logged in OpenSubtitlesServer
+            videos: list of Video instances
+        """
+        if self.strategy == 'both':
+            self._send(server, videos, ('file_search_query',
+                                        'hash_search_query'))
+        elif self.strategy == 'name-only':
+            self._send(server, videos, ('file_search_query',))
+        else:
+            self._send(server, videos, ('hash_search_query',))
+            pending = []
+            for video in videos:
+                if not self.confident(video):
+                    pending.append(video)
+                elif video.file_search_query:
+                    with self._lock:
+                        self.saved += 1
+            self._send(server, pending, ('file_search_query',))
+
+    def confident(self, video):
+        """
+        Check if subtitles already found for video include
+        a confident synced match
+
+        Args:
+            video: Video instance
+
+        Returns:
+            True if file search isn't needed, False otherwise
+        """
+        ranker = Ranker(video.ep_info, self.cutoff)
+        for _, subtitles in video.subtitle_lists():
+            ranked = ranker.rank(subtitles)
+            if not ranked or not ranked[0].subtitle.synced:
+                return False
+            if not (ranked[0].episode_match or
+                    ranker.ratio(ranked[0].subtitle.movie_name) >
+                    self.cutoff):
+                return False
+        return True
+
+    def _send(self, server, videos, query_names):
+        queries = []
+        owners = []
+        for video in videos:
+            for name in query_names:
+                query = getattr(video, name)
+                if query:
+                    queries += query
+                    owners += [video] * len(query)
+
+        if not queries:
+            return
+
+        with self._lock:
+            self.sent += len(queries)
+        for video, response in zip(owners, server.batch_query(queries)):
+            video.parse_response(response)
+
+    def __repr__(self):
+        return "<QueryPlanner {} sent {} saved {}>".format(
+            self.strategy, self.sent, self.saved)
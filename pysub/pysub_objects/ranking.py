@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import functools
+import collections
+
+from .parsing import guess_episode_info
+
+_title_chars = re.compile(r'[^a-zA-Z0-9\s+]')
+
+Candidate = collections.namedtuple('Candidate',
+                                   ['subtitle', 'episode_match', 'ratio'])
+Candidate.__doc__ = """Subtitle suitable for a video
+
+Attributes:
+    subtitle: Subtitle instance
+    episode_match: bool, series, season and episode are the same as video's
+    ratio: float, similarity of subtitle and video titles, or None if
+           it wasn't needed to accept the subtitle
+"""
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_title(movie_name):
+    """
+    Lower case title without punctuation, used for comparing titles
+
+    Args:
+        movie_name: str, movie or series name
+
+    Returns:
+        normalized title
+    """
+    return _title_chars.sub('', movie_name).lower()
+
+
+class Ranker(object):
+    """Chooses subtitles for one video
+
+    Subtitle is suitable if its series, season and episode number
+    match the video, if it's synced, or if its title is similar
+    enough to video series name and episode title. Subtitles from the
+    same series but a different episode are never suitable.
+
+    Title comparison is the most expensive part, so it's only done
+    when the subtitle isn't already accepted, and skipped when the
+    upper bounds of SequenceMatcher ratio are already below cutoff.
+
+    Attributes:
+        series: str, lower case series name of the video
+        season: season number of the video or None
+        episode: episode number of the video or None
+        title: str, normalized series name and episode title
+        cutoff: float, minimum title similarity ratio
+
+    """
+
+    def __init__(self, ep_info, cutoff):
+        """
+        Args:
+            ep_info: dict with video information from guessit
+            cutoff: float, minimum title similarity ratio
+        """
+        self.series = ep_info.get('series', "None").lower()
+        self.season = ep_info.get('season', None)
+        self.episode = ep_info.get('episodeNumber', None)
+        self.title = "{} {}".format(ep_info.get('series', "0").lower(),
+                                    ep_info.get('title', "0").lower())
+        self.cutoff = cutoff
+        import difflib
+        self._matcher = difflib.SequenceMatcher(None, "", "")
+        self._matcher.set_seq2(self.title)
+
+    def ratio(self, movie_name):
+        """
+        Similarity of movie_name and video title
+
+        Args:
+            movie_name: str, movie or series name of subtitle
+
+        Returns:
+            float ratio, or 0.0 if it's certainly not above cutoff
+        """
+        self._matcher.set_seq1(normalize_title(movie_name))
+        if (self._matcher.real_quick_ratio() <= self.cutoff or
+                self._matcher.quick_ratio() <= self.cutoff):
+            return 0.0
+        return self._matcher.ratio()
+
+    def candidates(self, subtitles):
+        """
+        Find suitable subtitles
+
+        Args:
+            subtitles: iterable of Subtitle instances
+
+        Yields:
+            Candidate for every suitable subtitle, in order of subtitles
+        """
+        for subtitle in subtitles:
+            sub_info = guess_episode_info(subtitle.sub_filename)
+
+            episode_match = False
+            if sub_info.get('series', "None Found").lower() == self.series:
+                sub_season = sub_info.get('season', None)
+                sub_episode = sub_info.get('episodeNumber', None)
+                if sub_season and self.season and sub_episode and self.episode:
+                    if [sub_season, sub_episode] != [self.season,
+                                                     self.episode]:
+                        continue
+                    episode_match = True
+
+            if episode_match or subtitle.synced:
+                yield Candidate(subtitle, episode_match, None)
+                continue
+
+            ratio = self.ratio(subtitle.movie_name)
+            if ratio > self.cutoff:
+                yield Candidate(subtitle, episode_match, ratio)
+
+    def rank(self, subtitles, stop_count=None):
+        """
+        Suitable subtitles, best one first
+
+        Best subtitle is the most downloaded one, but a synced subtitle
+        is only replaced by another synced one. Rest are sorted synced
+        first, then by download count.
+
+        If stop_count is set, remaining subtitles aren't looked at once
+        a synced subtitle of the same episode with at least stop_count
+        downloads is found.
+
+        Args:
+            subtitles: iterable of Subtitle instances
+            stop_count: int, download count of a good enough subtitle
+
+        Returns:
+            list of Candidate instances, empty if none are suitable
+        """
+        candidates = []
+        best = None
+        for candidate in self.candidates(subtitles):
+            candidates.append(candidate)
+            if best is None:
+                best = candidate
+            elif candidate.subtitle.download_count > \
+                    best.subtitle.download_count:
+                if best.subtitle.synced and not candidate.subtitle.synced:
+                    continue
+                best = candidate
+
+            if stop_count and best.episode_match and best.subtitle.synced \
+                    and best.subtitle.download_count >= stop_count:
+                break
+
+        if best is None:
+            return []
+
+        rest = [candidate for candidate in candidates if candidate is not best]
+        rest.sort(key=lambda candidate: (candidate.subtitle.synced,
+                                         candidate.subtitle.download_count),
+                  reverse=True)
+        return [best] + rest
+
+    def __repr__(self):
+        return "<Ranker {}>".format(self.title)
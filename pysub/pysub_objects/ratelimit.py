@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import random
+import threading
+
+from .metrics import default_metrics
+
+# API and HTTP statuses server uses when it's receiving too many requests
+THROTTLED_STATUSES = frozenset([407, 429, 503])
+
+
+def status_code(status):
+    """
+    Numeric code of API status such as '200 OK'
+
+    Args:
+        status: str, status from API response
+
+    Returns:
+        int status code or None if status is not valid
+    """
+    try:
+        return int(str(status).split()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+class RateLimiter(object):
+    """Token bucket limiting rate of requests to the server
+
+    Every request takes one token, tokens are refilled at rate per
+    second up to burst. When server reports it's throttling us, all
+    requests are paused for a jittered, exponentially growing delay
+    and the rate is halved. It grows back slowly with every
+    successful request, up to the configured rate.
+
+    With a SharedStore set, see use_store, tokens are taken from a
+    bucket in the store instead, so the rate is the budget of all
+    processes using the store together, and pauses apply to all
+    of them.
+
+    Attributes:
+        max_rate: float, configured requests per second
+        rate: float, current requests per second
+        burst: int, maximum number of tokens
+        min_rate: float, rate is never lowered below this
+        base_delay: float, seconds of first backoff delay
+        max_delay: float, maximum seconds of backoff delay
+        store: SharedStore the budget is kept in, or None
+        bucket: str, name of bucket in store
+
+    """
+
+    def __init__(self, rate=4.0, burst=4, min_rate=0.2,
+                 base_delay=1.0, max_delay=60.0):
+        """
+        Args:
+            rate: float, requests per second, 0 disables limiting
+            burst: int, maximum number of requests sent at once
+            min_rate: float, rate is never lowered below this
+            base_delay: float, seconds of first backoff delay
+            max_delay: float, maximum seconds of backoff delay
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._throttles = 0
+        self._lock = threading.Lock()
+        self.store = None
+        self.bucket = 'api'
+
+    def configure(self, rate=None, burst=None):
+        """
+        Change rate and burst of the limiter
+
+        Args:
+            rate: float, requests per second, 0 disables limiting
+            burst: int, maximum number of requests sent at once
+        """
+        with self._lock:
+            if rate is not None:
+                self.max_rate = self.rate = rate
+            if burst is not None:
+                self.burst = burst
+                self._tokens = min(self._tokens, burst)
+
+    def use_store(self, store, bucket='api'):
+        """
+        Share the budget with other processes, e.g. workers of
+        a sharded run on other hosts
+
+        Args:
+            store: SharedStore instance, or None to stop sharing
+            bucket: str, name of bucket in store
+        """
+        with self._lock:
+            self.store = store
+            self.bucket = bucket
+
+    def _wait_time(self, now):
+        if now < self._paused_until:
+            return self._paused_until - now
+        if not self.rate:
+            return 0
+        if self.store:
+            return self.store.take(self.bucket, self.rate, self.burst)
+
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """
+        Wait until a request can be sent
+        """
+        while True:
+            with self._lock:
+                wait = self._wait_time(time.monotonic())
+            if wait <= 0:
+                return
+            default_metrics.observe('rate_limit_wait', wait)
+            time.sleep(wait)
+
+    def backoff_delay(self, attempt):
+        """
+        Jittered exponential delay
+
+        Args:
+            attempt: int, number of failed attempts so far, from 0
+
+        Returns:
+            float, seconds to wait
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    def throttled(self):
+        """
+        Server is throttling us, pause all requests and lower the rate
+
+        Returns:
+            float, seconds requests are paused for
+        """
+        with self._lock:
+            delay = self.backoff_delay(self._throttles)
+            self._throttles += 1
+            self._paused_until = max(self._paused_until,
+                                     time.monotonic() + delay)
+            if self.rate:
+                self.rate = max(self.min_rate, self.rate / 2)
+            store = self.store
+        if store:
+            store.pause(self.bucket, delay)
+        default_metrics.count('throttled')
+        return delay
+
+    def succeeded(self):
+        """
+        Request succeeded, reset backoff and raise the rate
+        """
+        with self._lock:
+            self._throttles = 0
+            if self.rate:
+                self.rate = min(self.max_rate,
+                                self.rate + self.max_rate / 20)
+
+    def __repr__(self):
+        return "<RateLimiter {:.2f}/s>".format(self.rate)
+
+
+default_limiter = RateLimiter()
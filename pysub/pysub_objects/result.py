@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import collections
+
+from .cache import JobJournal
+
+
+class FileResult(object):
+    """What a batch run did for one video
+
+    Statuses are the JobJournal states, plus 'exists':
+        exists: subtitle already exists, video wasn't searched for
+        downloaded: subtitle was downloaded
+        no-results: no subtitles were found
+        skipped: none of the subtitles found is suitable
+        failed: search or download failed, see error
+
+    When more than one language is searched for, every language gets
+    its own subtitle and status, and status of the video is failed if
+    any of them failed, otherwise downloaded if any was downloaded,
+    exists if all of them exist, otherwise no-results if nothing was
+    found in some language.
+
+    Attributes:
+        path: str, absolute path of video
+        file_hash: str, hash of video or None if it wasn't hashed
+        queries: int, number of queries answered for video
+        status: str, one of statuses
+        error: str, why video failed or None
+        timings: dict with seconds spent on hash, search of the batch
+                 the video was in, and download
+        choices: OrderedDict with language, or None if only one is
+                 searched for, as key and tuple of Candidate, or None,
+                 and status as value
+
+    """
+    EXISTS = 'exists'
+    DOWNLOADED = JobJournal.DOWNLOADED
+    NO_RESULTS = JobJournal.NO_RESULTS
+    SKIPPED = JobJournal.SKIPPED
+    FAILED = JobJournal.FAILED
+
+    __slots__ = ('path', 'file_hash', 'queries', 'status', 'error',
+                 'timings', 'choices')
+
+    def __init__(self, path, status=None, file_hash=None, queries=0,
+                 error=None, timings=None):
+        """
+        Args:
+            path: str, absolute path of video
+            status: str, one of statuses, or None to set it from choices
+            file_hash: str, hash of video
+            queries: int, number of queries answered for video
+            error: str, why video failed
+            timings: dict with seconds spent on every step
+        """
+        self.path = path
+        self.status = status
+        self.file_hash = file_hash
+        self.queries = queries
+        self.error = error
+        self.timings = timings or {}
+        self.choices = collections.OrderedDict()
+
+    def choose(self, language, candidate, status):
+        """
+        Record subtitle chosen for language and status of video is
+        updated, see statuses
+
+        Args:
+            language: str, language code or None if only one is
+                      searched for
+            candidate: Candidate chosen or None
+            status: str, what happened in this language
+        """
+        self.choices[language] = (candidate, status)
+        statuses = [choice[1] for choice in self.choices.values()]
+        if self.FAILED in statuses:
+            self.status = self.FAILED
+        elif self.DOWNLOADED in statuses:
+            self.status = self.DOWNLOADED
+        elif all(state == self.EXISTS for state in statuses):
+            self.status = self.EXISTS
+        elif self.NO_RESULTS in statuses:
+            self.status = self.NO_RESULTS
+        else:
+            self.status = self.SKIPPED
+
+    @staticmethod
+    def _subtitle(candidate):
+        if candidate is None:
+            return None, None
+        # subtitles accepted without comparing titles score 1.0
+        score = 1.0 if candidate.ratio is None else round(candidate.ratio, 4)
+        return candidate.subtitle.sub_id, score
+
+    def as_dict(self):
+        """
+        Returns:
+            OrderedDict with path, hash, queries, subtitle_id, score,
+            status, error and timings, and languages with
+            subtitle_id, score and status for every language if
+            more than one is searched for
+        """
+        single = None in self.choices or not self.choices
+        candidate = self.choices[None][0] if None in self.choices else None
+        subtitle_id, score = self._subtitle(candidate)
+        result = collections.OrderedDict([
+            ('path', self.path),
+            ('hash', self.file_hash),
+            ('queries', self.queries),
+            ('subtitle_id', subtitle_id),
+            ('score', score),
+            ('status', self.status),
+            ('error', self.error),
+            ('timings', collections.OrderedDict(
+                (step, round(seconds, 6))
+                for step, seconds in sorted(self.timings.items())))])
+
+        if not single:
+            languages = collections.OrderedDict()
+            for language, (candidate, status) in self.choices.items():
+                subtitle_id, score = self._subtitle(candidate)
+                languages[language] = collections.OrderedDict([
+                    ('subtitle_id', subtitle_id), ('score', score),
+                    ('status', status)])
+            result['languages'] = languages
+        return result
+
+    def to_json(self):
+        """
+        Returns:
+            str, result as JSON on a single line
+        """
+        return json.dumps(self.as_dict())
+
+    def __repr__(self):
+        return "<FileResult {} {}>".format(self.status, self.path)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import xmlrpc.client as xmlrpclib
+
+
+class PooledTransport(xmlrpclib.Transport):
+    """XMLRPC transport taking its connections from ConnectionPool
+
+    Attributes:
+        pool: ConnectionPool instance
+        scheme: str, 'http' or 'https'
+
+    """
+
+    def __init__(self, pool, scheme='http'):
+        """
+        Args:
+            pool: ConnectionPool to take connections from
+            scheme: str, 'http' or 'https'
+        """
+        super(PooledTransport, self).__init__()
+        self.pool = pool
+        self.scheme = scheme
+
+    def make_connection(self, host):
+        if self._connection[1] is None or self._connection[0] != host:
+            chost, self._extra_headers, _ = self.get_host_info(host)
+            self._connection = host, self.pool.acquire(self.scheme, chost)
+        return self._connection[1]
+
+    def request(self, host, handler, request_body, verbose=False):
+        try:
+            return super(PooledTransport, self).request(host, handler,
+                                                        request_body,
+                                                        verbose)
+        finally:
+            # connection is closed and cleared by Transport on errors
+            host, connection = self._connection
+            self._connection = (None, None)
+            if connection:
+                self.pool.release(self.scheme,
+                                  self.get_host_info(host)[0], connection)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+
+def subtitle_name(name):
+    """
+    Subtitle file name with its extension in lower case, names are
+    kept like this so extensions match case insensitively
+
+    Args:
+        name: str, file name
+
+    Returns:
+        str, normalized file name
+    """
+    root, extension = os.path.splitext(name)
+    return root + extension.lower()
+
+
+class Scanner(object):
+    """Finds video files in folders
+
+    Every directory is listed once with os.scandir. Video files are
+    matched by extension and names of subtitle files found in the
+    same listing are kept, so they don't have to be looked up later.
+
+    If directory_cache is set, directories whose modification time
+    didn't change since they were last recorded are skipped together
+    with the videos in them, their subdirectories are still scanned.
+    Directories are recorded by commit, once their videos have been
+    processed, so an interrupted run doesn't skip them later.
+
+    Extensions are matched case insensitively.
+
+    Attributes:
+        file_ext: frozenset, video file extensions
+        sub_ext: frozenset, subtitle file extensions
+        directory_cache: DirectoryCache instance or None
+        subtitles: dict with scanned directory path as key and set
+                   of subtitle file names in it, see subtitle_name,
+                   as value
+        skipped: int, number of unchanged directories skipped
+        scanned: dict with scanned directory path as key and tuple of
+                 its subdirectories and videos as value, directories
+                 not recorded by commit yet, kept only with
+                 directory_cache
+
+    """
+
+    def __init__(self, file_ext, sub_ext=(), directory_cache=None):
+        """
+        Args:
+            file_ext: iterable of video file extensions, e.g. '.mkv'
+            sub_ext: iterable of subtitle file extensions, e.g. '.srt'
+            directory_cache: DirectoryCache used to skip unchanged
+                             directories
+        """
+        self.file_ext = frozenset(ext.lower() for ext in file_ext)
+        self.sub_ext = frozenset(ext.lower() for ext in sub_ext)
+        self.directory_cache = directory_cache
+        self.subtitles = {}
+        self.skipped = 0
+        self.scanned = {}
+
+    def scan(self, folder, recursive=False):
+        """
+        Find all video files in folder
+
+        Args:
+            folder: str, path of folder to scan
+            recursive: bool, scan subfolders too
+
+        Returns:
+            list of video file paths, sorted by folder and name
+        """
+        videos = []
+        pending = [folder]
+        while pending:
+            subdirs = self.scan_directory(pending.pop(), videos)
+            if recursive:
+                pending.extend(reversed(subdirs))
+        return videos
+
+    def scan_directory(self, path, videos):
+        """
+        List one directory and add video files found in it to videos
+
+        Args:
+            path: str, path of directory
+            videos: list to which video file paths are appended
+
+        Returns:
+            list of subdirectory paths
+        """
+        if self.directory_cache:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                return []
+            cached = self.directory_cache.get(path)
+            if cached and cached[0] == mtime:
+                self.skipped += 1
+                return cached[1]
+
+        subdirs = []
+        found = []
+        subtitles = set()
+        try:
+            entries = sorted(os.scandir(path), key=lambda entry: entry.name)
+        except OSError:
+            return []
+
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+                continue
+
+            extension = os.path.splitext(entry.name)[1].lower()
+            if extension in self.file_ext:
+                found.append(entry.path)
+            elif extension in self.sub_ext:
+                subtitles.add(subtitle_name(entry.name))
+
+        videos.extend(found)
+        self.subtitles[path] = subtitles
+        if self.directory_cache:
+            self.scanned[path] = (subdirs, found)
+        return subdirs
+
+    def commit(self, done=None):
+        """
+        Record scanned directories in directory_cache, so later scans
+        skip them while they're unchanged. A directory is recorded only
+        if done is true for every video in it, with its modification
+        time after the videos were processed, e.g. subtitles were saved.
+
+        Args:
+            done: callable taking video path, True if nothing more has
+                  to be done for the video. If not set every video is
+                  done
+        """
+        for path, (subdirs, videos) in list(self.scanned.items()):
+            if done and not all(done(video) for video in videos):
+                continue
+            del self.scanned[path]
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            self.directory_cache.set(path, mtime, subdirs)
+
+    def __repr__(self):
+        return "<Scanner {} folders>".format(len(self.subtitles))
+
+
+class SubtitleIndex(object):
+    """Names of subtitle files in folders
+
+    Each folder is listed at most once, after that checking whether
+    a subtitle exists in it is a set lookup. Listings from Scanner
+    can be passed in so scanned folders aren't listed again.
+    Extensions are matched case insensitively.
+
+    Attributes:
+        sub_ext: frozenset, subtitle file extensions
+        listings: dict with absolute folder path as key and set of
+                  subtitle file names in it, see subtitle_name, as value
+
+    """
+
+    def __init__(self, sub_ext, listings=None):
+        """
+        Args:
+            sub_ext: iterable of subtitle file extensions, e.g. '.srt'
+            listings: dict with folder path as key and set of subtitle
+                      file names as value, e.g. Scanner.subtitles
+        """
+        self.sub_ext = frozenset(ext.lower() for ext in sub_ext)
+        self.listings = {os.path.abspath(folder): names
+                         for folder, names in (listings or {}).items()}
+
+    def names(self, folder):
+        """
+        Names of subtitle files in folder
+
+        Args:
+            folder: str, path of folder
+
+        Returns:
+            set of file names, empty if folder doesn't exist
+        """
+        folder = os.path.abspath(folder)
+        names = self.listings.get(folder)
+        if names is None:
+            names = set()
+            try:
+                for entry in list(os.scandir(folder)):
+                    name = subtitle_name(entry.name)
+                    if os.path.splitext(name)[1] in self.sub_ext:
+                        names.add(name)
+            except OSError:
+                pass
+            self.listings[folder] = names
+        return names
+
+    def add(self, file_path):
+        """
+        Record subtitle saved at file_path, so folders listed before
+        it was saved don't have to be listed again
+
+        Args:
+            file_path: str, path of saved subtitle file
+        """
+        names = self.listings.get(os.path.dirname(os.path.abspath(file_path)))
+        if names is not None:
+            names.add(subtitle_name(os.path.basename(file_path)))
+
+    def exists(self, folder, file_names):
+        """
+        Check if subtitle with any of file_names, followed by one of
+        subtitle extensions, exists in folder
+
+        Args:
+            folder: str, path of folder
+            file_names: iterable of file names without subtitle extension
+
+        Returns:
+            True if any of the subtitles exists, False otherwise
+        """
+        names = self.names(folder)
+        if not names:
+            return False
+        return any(name + sub_format in names
+                   for name in file_names for sub_format in self.sub_ext)
+
+    def __repr__(self):
+        return "<SubtitleIndex {} folders>".format(len(self.listings))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Partitioning of videos between workers of a sharded run
+
+Videos are assigned to shards by consistent hashing of their path
+relative to the scanned folder, so every host computes the same
+assignment wherever the library is mounted, and changing the number
+of shards moves only a small part of the videos to other shards.
+"""
+
+import os
+import bisect
+import hashlib
+
+SHARD_BY = ('path', 'directory')
+
+
+def shard_key(file_path, root, by='path'):
+    """
+    Key video is hashed by, the same on every host
+
+    Args:
+        file_path: str, path of video
+        root: str, path of scanned folder the video is in
+        by: str, 'path' to spread videos of a folder over all shards,
+            'directory' to keep them in the same shard
+
+    Returns:
+        str, path, or folder path, relative to root with / separators
+    """
+    key = os.path.relpath(os.path.abspath(file_path), os.path.abspath(root))
+    if by == 'directory':
+        key = os.path.dirname(key)
+    return key.replace(os.sep, '/')
+
+
+def _point(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8],
+                          'big')
+
+
+class HashRing(object):
+    """Consistent hashing of keys to shards
+
+    Every shard is placed on the ring at replicas points, a key
+    belongs to the shard of the first point after the key's hash.
+
+    Attributes:
+        shards: int, number of shards
+
+    """
+
+    def __init__(self, shards, replicas=64):
+        """
+        Args:
+            shards: int, number of shards
+            replicas: int, points of every shard on the ring, more
+                      points spread keys more evenly
+
+        Raises:
+            ValueError: if shards is less than 1
+        """
+        if shards < 1:
+            raise ValueError("Number of shards must be at least 1")
+        self.shards = shards
+        points = sorted((_point("{}-{}".format(shard, replica)), shard)
+                        for shard in range(shards)
+                        for replica in range(replicas))
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard(self, key):
+        """
+        Args:
+            key: str, e.g. from shard_key
+
+        Returns:
+            int, shard of key, from 0 to shards - 1
+        """
+        index = bisect.bisect(self._points, _point(key))
+        return self._owners[index % len(self._points)]
+
+    def __repr__(self):
+        return "<HashRing {} shards>".format(self.shards)
+
+
+def partition(file_list, root, shards, by='path'):
+    """
+    Split videos into shards
+
+    Args:
+        file_list: list, paths of videos
+        root: str, path of scanned folder videos are in
+        shards: int, number of shards
+        by: str, one of SHARD_BY, see shard_key
+
+    Returns:
+        list with list of video paths for every shard, in order of
+        file_list
+    """
+    ring = HashRing(shards)
+    parts = [[] for _ in range(shards)]
+    for file_path in file_list:
+        parts[ring.shard(shard_key(file_path, root, by))].append(file_path)
+    return parts
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import abc
+import json
+import time
+import sqlite3
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows, only SQLite locking is used
+    fcntl = None
+
+from .cache import SearchCache
+
+
+class SharedStore(abc.ABC):
+    """Storage shared by all workers of a sharded run
+
+    Keeps JSON values in namespaces, e.g. search results, shard
+    manifests and results of workers, and token buckets holding the
+    request budget of all workers together. Subclasses implement it
+    on top of some storage every worker host can reach; every method
+    must be atomic across hosts.
+
+    Times are wall clock time.time() values, so clocks of worker
+    hosts should be kept in sync.
+
+    """
+
+    @abc.abstractmethod
+    def get(self, namespace, key):
+        """
+        Args:
+            namespace: str, e.g. 'searches'
+            key: str, key within namespace
+
+        Returns:
+            tuple of stored value and time it was stored, or None
+        """
+
+    @abc.abstractmethod
+    def set(self, namespace, key, value):
+        """
+        Store value, replacing the previous one
+
+        Args:
+            namespace: str, e.g. 'searches'
+            key: str, key within namespace
+            value: value that can be stored as JSON
+        """
+
+    @abc.abstractmethod
+    def items(self, namespace):
+        """
+        Args:
+            namespace: str, e.g. 'results'
+
+        Returns:
+            list of tuples of key and value, ordered by key
+        """
+
+    @abc.abstractmethod
+    def expire(self, namespace, max_age):
+        """
+        Remove values stored more than max_age seconds ago
+
+        Args:
+            namespace: str, e.g. 'searches'
+            max_age: float, seconds
+        """
+
+    @abc.abstractmethod
+    def take(self, bucket, rate, burst):
+        """
+        Take one token from bucket, refilled at rate per second up
+        to burst tokens, see RateLimiter
+
+        Args:
+            bucket: str, name of bucket, e.g. 'api'
+            rate: float, tokens added per second
+            burst: int, maximum number of tokens
+
+        Returns:
+            float, 0 if token was taken, otherwise seconds to wait
+            before trying again
+        """
+
+    @abc.abstractmethod
+    def pause(self, bucket, seconds):
+        """
+        Don't give out tokens from bucket for seconds, e.g. when
+        server is throttling us
+
+        Args:
+            bucket: str, name of bucket
+            seconds: float, length of pause
+        """
+
+    def close(self):
+        """
+        Release resources held by the store
+        """
+        pass
+
+
+class SQLiteStore(SharedStore):
+    """SharedStore in SQLite database, e.g. on a network share
+
+    SQLite locking isn't reliable on network file systems, so every
+    operation also holds an exclusive lock of path.lock, taken with
+    flock where it's available. Every operation is committed at once.
+
+    Attributes:
+        path: str, absolute path of the database file
+
+    """
+    schema = ("CREATE TABLE IF NOT EXISTS store ("
+              "namespace TEXT, key TEXT, value TEXT, updated REAL, "
+              "PRIMARY KEY (namespace, key))",
+              "CREATE TABLE IF NOT EXISTS buckets ("
+              "name TEXT PRIMARY KEY, tokens REAL, updated REAL, "
+              "paused_until REAL)")
+
+    def __init__(self, path, timeout=30):
+        """
+        Open or create database at path
+
+        Args:
+            path: str, absolute path of the database file
+            timeout: float, seconds to wait for a locked database
+
+        Raises:
+            sqlite3.Error: if database can't be opened
+            OSError: if folder for database can't be created
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        self._lock_file = open(path + ".lock", "a")
+        self._db = sqlite3.connect(path, timeout=timeout,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+        with self._transaction() as db:
+            for statement in self.schema:
+                db.execute(statement)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            if fcntl:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    yield self._db
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+                self._db.execute("COMMIT")
+            finally:
+                if fcntl:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def get(self, namespace, key):
+        with self._transaction() as db:
+            row = db.execute("SELECT value, updated FROM store "
+                             "WHERE namespace = ? AND key = ?",
+                             (namespace, key)).fetchone()
+        if row:
+            return json.loads(row[0]), row[1]
+        return None
+
+    def set(self, namespace, key, value):
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO store VALUES (?, ?, ?, ?)",
+                       (namespace, key, json.dumps(value), time.time()))
+
+    def items(self, namespace):
+        with self._transaction() as db:
+            rows = db.execute("SELECT key, value FROM store "
+                              "WHERE namespace = ? ORDER BY key",
+                              (namespace,)).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def expire(self, namespace, max_age):
+        with self._transaction() as db:
+            db.execute("DELETE FROM store WHERE namespace = ? "
+                       "AND updated < ?", (namespace, time.time() - max_age))
+
+    def take(self, bucket, rate, burst):
+        with self._transaction() as db:
+            now = time.time()
+            row = db.execute("SELECT tokens, updated, paused_until "
+                             "FROM buckets WHERE name = ?",
+                             (bucket,)).fetchone()
+            tokens, updated, paused_until = row or (burst, now, 0.0)
+            if now < paused_until:
+                return paused_until - now
+
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            db.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)",
+                       (bucket, tokens, now, paused_until))
+        return wait
+
+    def pause(self, bucket, seconds):
+        with self._transaction() as db:
+            now = time.time()
+            row = db.execute("SELECT tokens, updated, paused_until "
+                             "FROM buckets WHERE name = ?",
+                             (bucket,)).fetchone()
+            tokens, updated, paused_until = row or (0.0, now, 0.0)
+            db.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)",
+                       (bucket, tokens, updated,
+                        max(paused_until, now + seconds)))
+
+    def close(self):
+        """
+        Close the database
+        """
+        with self._lock:
+            self._db.close()
+            self._lock_file.close()
+
+    def __repr__(self):
+        return "<SQLiteStore {}>".format(self.path)
+
+
+class SharedSearchCache(object):
+    """Search results kept in SharedStore, used like SearchCache
+
+    Workers searching for the same episode or file hash reuse
+    results found by any of them.
+
+    Attributes:
+        store: SharedStore instance
+        ttl: int, seconds for which found subtitles are used
+        negative_ttl: int, seconds for which empty results are used
+        refresh: bool, ignore stored results, new ones are still stored
+
+    """
+    namespace = 'searches'
+
+    def __init__(self, store, ttl=7 * 86400, negative_ttl=86400,
+                 refresh=False):
+        """
+        Args:
+            store: SharedStore instance
+            ttl: int, seconds for which found subtitles are used
+            negative_ttl: int, seconds for which empty results are used
+            refresh: bool, ignore stored results
+        """
+        self.store = store
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.refresh = refresh
+
+    def get(self, query):
+        """
+        Get stored result of query, see SearchCache.get
+        """
+        if self.refresh:
+            return None
+
+        stored = self.store.get(self.namespace, SearchCache._key(query))
+        if not stored:
+            return None
+        data, searched = stored
+        ttl = self.ttl if data else self.negative_ttl
+        if time.time() - searched > ttl:
+            return None
+        return data
+
+    def set(self, query, data):
+        """
+        Store result of query, see SearchCache.set
+        """
+        self.store.set(self.namespace, SearchCache._key(query), data)
+
+    def close(self):
+        """
+        Remove expired results, the store itself isn't closed
+        """
+        self.store.expire(self.namespace, max(self.ttl, self.negative_ttl))
+
+    def __repr__(self):
+        return "<SharedSearchCache {!r}>".format(self.store)
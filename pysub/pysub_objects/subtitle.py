@@ -16,9 +16,25 @@
 # limitations under the License.
 
 import os
-import gzip
-from urllib import request
-from io import StringIO
+import sys
+import zlib
+import time
+import functools
+import threading
+
+from .transport import HTTPError, default_pool
+from .ratelimit import THROTTLED_STATUSES, default_limiter
+from .metrics import default_metrics
+
+
+def intern(value):
+    """
+    Intern value if it's a string, repeated values like movie names
+    and formats then share one object between all subtitles.
+    """
+    if type(value) is str:
+        return sys.intern(value)
+    return value
 
 
 class Subtitle(object):
@@ -29,6 +45,7 @@ class Subtitle(object):
     the subtitle from server to location passed from video class.
 
     Attributes:
+        sub_id: str or None, IDSubtitleFile of the subtitle
         synced: bool, true if subtitle is found by hash search
         movie_name: str or None, name of the movie or Series name
         episode_num: int or None, episode number
@@ -38,11 +55,19 @@ class Subtitle(object):
         sub_format: str or none, format of the subtitle, used in saving
         sub_filename: str or none, name of subtitle file on subtitles
         save_path: str, absolute path of folder to save subtitle to
+        video_fname: str, name of video file this subtitle is for
+        language: str or None, ISO 639-2 code added to saved file name
         full_path: str, absolute path of subtitle to save to
 
+    Bulk searches create a lot of instances, so attributes are kept
+    in __slots__ and repeated strings are interned.
+
     """
+    __slots__ = ('sub_id', 'synced', 'movie_name', 'episode_num', 'season_num',
+                 'download_link', 'download_count', 'sub_format',
+                 'sub_filename', 'save_path', 'video_fname', 'language')
 
-    def __init__(self, json_data, save_path, video_fname):
+    def __init__(self, json_data, save_path, video_fname, language=None):
         """
         Initialize Subtitle class with one subtitle json data and
         information for saving subtitle
@@ -53,47 +78,220 @@ class Subtitle(object):
             save_path: folder where to save subtitle, string
             video_fname: original name of video file associated with
                          this subtitle, string.
+            language: ISO 639-2 code saved file name is tagged with,
+                      e.g. video.mkv.eng.srt, string or None
 
         """
+        self.sub_id = json_data.get('IDSubtitleFile')
         self.synced = json_data.get('MatchedBy') == "moviehash"
-        self.movie_name = json_data.get('MovieName', "")
-        self.episode_num = json_data.get('SeriesEpisode')
-        self.season_num = json_data.get('SeriesSeason')
+        self.movie_name = intern(json_data.get('MovieName', ""))
+        self.episode_num = intern(json_data.get('SeriesEpisode'))
+        self.season_num = intern(json_data.get('SeriesSeason'))
         self.download_link = json_data.get('SubDownloadLink')
         self.download_count = int(json_data.get('SubDownloadsCnt', -1))
-        self.sub_format = json_data.get('SubFormat')
+        self.sub_format = intern(json_data.get('SubFormat'))
         self.sub_filename = json_data.get('SubFileName')
         self.save_path = save_path
-        self.full_path = "{folder}{name}.{format}".format(
-            folder=self.save_path,
-            name=video_fname,
-            format=self.sub_format)
+        self.video_fname = video_fname
+        self.language = language
 
-    def download(self):
+    @property
+    def full_path(self):
+        """
+        Absolute path of subtitle to save to, built from save_path,
+        video file name, language if set and subtitle format
+        """
+        name = self.video_fname
+        if self.language:
+            name = "{}.{}".format(name, self.language)
+        return "{folder}{name}.{format}".format(folder=self.save_path,
+                                                name=name,
+                                                format=self.sub_format)
+
+    def download(self, pool=None, chunk_size=65536, limiter=None,
+                 quiet=False):
         """
         Download subtitle to folder/file specified in self.full_path
         variable.
 
+        Response is decompressed while it's being downloaded and
+        written to a temporary file in the same folder, which replaces
+        full_path only once the whole subtitle is saved. Truncated
+        responses are treated as failed downloads.
+
+        Args:
+            pool: ConnectionPool to download with, default_pool if not set
+            chunk_size: int, number of bytes read from response at once
+            limiter: RateLimiter download waits for, default_limiter
+                     if not set
+            quiet: bool, don't print anything, e.g. when downloading
+                   in worker threads whose caller reports the result
+
+        Returns:
+            True if subtitle was saved, False otherwise
         """
+        limiter = limiter or default_limiter
         if not os.path.isdir(self.save_path):
             try:
                 os.mkdir(self.save_path)
             except IOError:
-                print("Can't create subfolder. "
-                      "Check that you have write access for "
-                      "{}".format(self.save_path))
+                if not quiet:
+                    print("Can't create subfolder. "
+                          "Check that you have write access for "
+                          "{}".format(self.save_path))
 
-        sub_zip_file = request.urlopen(self.download_link)
-        sub_gzip = gzip.GzipFile(fileobj=StringIO(sub_zip_file.read()))
-        subtitle_content = sub_gzip.read()
+        temp_path = "{}.{}-{}.part".format(self.full_path, os.getpid(),
+                                           threading.get_ident())
         try:
-            with open(self.full_path, 'wb') as subtitle_output:
-                subtitle_output.write(subtitle_content)
-            print("Downloaded subtitle...")
+            subtitle_output = open(temp_path, 'wb')
         except IOError:
-            print("Couldn't save subtitle, permissions issue?")
+            if not quiet:
+                print("Couldn't save subtitle, permissions issue?")
+            return False
+
+        # IncompleteRead and BadStatusLine aren't IOErrors
+        from http.client import HTTPException
+
+        limiter.acquire()
+        received = 0
+        start = time.perf_counter()
+        try:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            with subtitle_output, \
+                    (pool or default_pool).get(self.download_link) as response:
+                for chunk in iter(lambda: response.read(chunk_size), b''):
+                    received += len(chunk)
+                    subtitle_output.write(decompressor.decompress(chunk))
+                subtitle_output.write(decompressor.flush())
+            if not decompressor.eof:
+                raise IOError("Download ended after {} bytes, subtitle "
+                              "is incomplete".format(received))
+            os.replace(temp_path, self.full_path)
+            limiter.succeeded()
+            default_metrics.count('downloads')
+        except (IOError, zlib.error, HTTPException) as err:
+            if isinstance(err, HTTPError) and err.status in THROTTLED_STATUSES:
+                limiter.throttled()
+            default_metrics.count('download_failures')
+            if not quiet:
+                print("Couldn't download subtitle. {}".format(err))
+            return False
+        finally:
+            default_metrics.observe('download', time.perf_counter() - start)
+            default_metrics.count('download_bytes', received)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        if not quiet:
+            print("Downloaded subtitle...")
+        return True
+
+    async def download_async(self, pool=None, executor=None, limiter=None,
+                             quiet=False):
+        """
+        Download subtitle without blocking the event loop, download
+        is done by executor or loop default executor.
+
+        Args:
+            pool: ConnectionPool to download with, default_pool if not set
+            executor: concurrent.futures.Executor to download in
+            limiter: RateLimiter download waits for
+            quiet: bool, don't print anything, e.g. when several
+                   downloads run at once, see download
+
+        Returns:
+            True if subtitle was saved, False otherwise
+        """
+        import asyncio
+        # get_running_loop is new in Python 3.7
+        loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+        return await loop.run_in_executor(executor, functools.partial(
+            self.download, pool, limiter=limiter, quiet=quiet))
 
     def __repr__(self):
         return "<Sub {}S{}E{}>".format(self.movie_name,
                                        self.season_num,
                                        self.episode_num)
+
+
+class SubtitleList(object):
+    """Lazy list of subtitles found for one video
+
+    Keeps subtitle json data from server responses and creates
+    Subtitle instances only when they are accessed, json data of a
+    subtitle is released once its instance is created. The same
+    subtitle found by more than one query is kept once, hash
+    search result is preferred since it marks subtitle as synced.
+
+    Attributes:
+        save_path: str, absolute path of folder to save subtitles to
+        video_fname: str, name of video file subtitles are for
+        language: str or None, language code subtitles are saved with
+
+    """
+    __slots__ = ('save_path', 'video_fname', 'language', '_rows',
+                 '_subtitles', '_ids')
+
+    def __init__(self, save_path, video_fname, language=None):
+        """
+        Args:
+            save_path: folder where to save subtitles, string
+            video_fname: original name of video file, string
+            language: ISO 639-2 code added to saved file names, if any
+        """
+        self.save_path = save_path
+        self.video_fname = video_fname
+        self.language = language
+        self._rows = []
+        self._subtitles = []
+        self._ids = {}
+
+    def extend(self, rows):
+        """
+        Add subtitles from server response
+
+        Args:
+            rows: list of json/dicts, one for each subtitle
+        """
+        for row in rows:
+            sub_id = row.get('IDSubtitleFile')
+            num = self._ids.get(sub_id) if sub_id is not None else None
+
+            if num is None:
+                if sub_id is not None:
+                    self._ids[sub_id] = len(self._rows)
+                self._rows.append(row)
+                self._subtitles.append(None)
+
+            elif row.get('MatchedBy') == "moviehash" and \
+                    not self._synced(num):
+                self._rows[num] = row
+                self._subtitles[num] = None
+
+    def _synced(self, num):
+        subtitle = self._subtitles[num]
+        if subtitle is not None:
+            return subtitle.synced
+        return self._rows[num].get('MatchedBy') == "moviehash"
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, num):
+        if isinstance(num, slice):
+            return [self[index] for index in range(*num.indices(len(self)))]
+
+        subtitle = self._subtitles[num]
+        if subtitle is None:
+            subtitle = Subtitle(self._rows[num], self.save_path,
+                                self.video_fname, self.language)
+            self._subtitles[num] = subtitle
+            self._rows[num] = None
+        return subtitle
+
+    def __iter__(self):
+        for num in range(len(self._rows)):
+            yield self[num]
+
+    def __repr__(self):
+        return "<SubtitleList {} subtitles>".format(len(self))
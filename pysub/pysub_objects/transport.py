@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import contextlib
+from urllib.parse import urlsplit, urljoin
+
+
+class HTTPError(IOError):
+    """Non 200 response to GET request
+
+    Attributes:
+        status: int, HTTP status code of the response
+
+    """
+
+    def __init__(self, message, status):
+        super(HTTPError, self).__init__(message)
+        self.status = status
+
+
+class ConnectionPool(object):
+    """Keep-alive HTTP connections shared between threads
+
+    Connections are taken from the pool for one request and
+    returned to it afterwards, so the same TCP/TLS connection
+    is reused by all API calls and downloads to the same host.
+
+    Attributes:
+        size: int, number of idle connections kept for every host
+        timeout: int, socket timeout in seconds for new connections
+
+    """
+
+    def __init__(self, size=4, timeout=30):
+        """
+        Args:
+            size: int, number of idle connections kept for every host
+            timeout: int, socket timeout in seconds for new connections
+        """
+        self.size = size
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def configure(self, size=None, timeout=None):
+        """
+        Change pool size and timeout, already open connections are kept
+
+        Args:
+            size: int, number of idle connections kept for every host
+            timeout: int, socket timeout in seconds for new connections
+        """
+        if size is not None:
+            self.size = size
+        if timeout is not None:
+            self.timeout = timeout
+
+    def acquire(self, scheme, host):
+        """
+        Get idle connection to host or open a new one
+
+        Args:
+            scheme: str, 'http' or 'https'
+            host: str, host with optional port
+
+        Returns:
+            HTTPConnection or HTTPSConnection instance
+        """
+        with self._lock:
+            idle = self._idle.get((scheme, host))
+            if idle:
+                return idle.pop()
+
+        # http.client pulls in ssl, it's only loaded once it's needed
+        import http.client
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, timeout=self.timeout)
+        return http.client.HTTPConnection(host, timeout=self.timeout)
+
+    def release(self, scheme, host, connection):
+        """
+        Return connection to the pool, it's closed if pool is full
+
+        Args:
+            scheme: str, 'http' or 'https'
+            host: str, host with optional port
+            connection: connection from acquire, with response read
+        """
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host), [])
+            if len(idle) < self.size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    @contextlib.contextmanager
+    def get(self, url, headers=None, redirects=5):
+        """
+        Make GET request to url using pooled connection, redirects
+        are followed. Connection is returned to the pool when the
+        block exits, unread part of the response is discarded.
+
+        Args:
+            url: str, absolute http or https url
+            headers: dict with additional request headers
+            redirects: int, number of redirects to follow
+
+        Yields:
+            http.client.HTTPResponse with status 200
+
+        Raises:
+            IOError: on connection errors, HTTPError on
+                     non 200 responses
+        """
+        for _ in range(redirects + 1):
+            parts = urlsplit(url)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+
+            connection, response = self._send(parts.scheme, parts.netloc,
+                                              path, headers or {})
+            redirect = response.status in (301, 302, 303, 307, 308)
+            try:
+                if redirect:
+                    url = urljoin(url, response.getheader('Location'))
+                    response.read()
+                elif response.status != 200:
+                    raise HTTPError("HTTP Error {} {} for {}".format(
+                        response.status, response.reason, url),
+                        response.status)
+                else:
+                    yield response
+                    response.read()
+            except BaseException:
+                connection.close()
+                raise
+
+            self.release(parts.scheme, parts.netloc, connection)
+            if not redirect:
+                return
+
+        raise IOError("Too many redirects for {}".format(url))
+
+    def _send(self, scheme, host, path, headers):
+        # an idle connection may have been closed by the server,
+        # retry once on a new one
+        import http.client
+        for attempt in (0, 1):
+            connection = self.acquire(scheme, host)
+            try:
+                connection.request("GET", path, headers=headers)
+                return connection, connection.getresponse()
+            except (http.client.RemoteDisconnected,
+                    ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        """
+        Close all idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def __repr__(self):
+        return "<ConnectionPool {} hosts>".format(len(self._idle))
+
+
+default_pool = ConnectionPool()
@@ -15,14 +15,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import re
 import os
-import struct
-import difflib
 
-import guessit
-
-from .subtitle import Subtitle
+from .subtitle import SubtitleList
+from .hashing import hash_file
+from .scanner import SubtitleIndex
+from .parsing import guess_episode_info
+from .ranking import Ranker
+from .metrics import default_metrics
 
 
 class Video(object):
@@ -40,8 +40,16 @@ class Video(object):
         file_path: absolute path of video file
         file_name: name of file
         file_size: file size in bytes
+        file_stat: os.stat_result of the file
+        hash_cache: HashCache instance or None
+        sub_index: SubtitleIndex used to check if subtitle exists
         ep_info: dictionary from guessit module
-        subtitles: list of all subtitles found for this file
+        subtitles: SubtitleList of all subtitles found for this file
+        by_language: dict with SubtitleList for every language when
+                     more than one is searched for, otherwise empty
+        search_failed: bool, at least one query for this file failed
+        queries: int, number of queries answered for this file,
+                 from server or search cache
 
         sub_path: full absolute path to where sub should be saved
         file_hash: hash for this file or None
@@ -50,13 +58,22 @@ class Video(object):
         hash_search_query: query based on file hash/size data
 
     """
+    __slots__ = ('config', 'file_path', 'file_name', 'file_stat',
+                 'file_size', 'hash_cache', '_file_hash', 'sub_index',
+                 '_ep_info', 'subtitles', 'by_language', 'search_failed',
+                 'queries')
 
-    def __init__(self, file_path, config):
+    def __init__(self, file_path, config, hash_cache=None, file_hash=None,
+                 sub_index=None):
         """
         Initalizing class for file specified in file_path
 
         Attributes:
             file_path: String with absolute path to file
+            hash_cache: HashCache used to look up and store file hash
+            file_hash: String with already calculated hash of the file
+            sub_index: SubtitleIndex shared between videos, if not set
+                       folders of this video are listed on their own
 
         Raises:
             IOError: if file does not exist in that location
@@ -64,11 +81,24 @@ class Video(object):
         self.config = config
         self.file_path = file_path
         self.file_name = os.path.basename(file_path)
-        self.file_size = os.path.getsize(file_path)
-
-        self.ep_info = guessit.guess_episode_info(file_path)
-
-        self.subtitles = []
+        self.file_stat = os.stat(file_path)
+        self.file_size = self.file_stat.st_size
+        self.hash_cache = hash_cache
+        self._file_hash = file_hash
+        self.sub_index = sub_index or SubtitleIndex(config['sub_ext'])
+
+        self._ep_info = None
+
+        self.subtitles = SubtitleList(self.sub_path, self.file_name)
+        self.by_language = {}
+        languages = config['lang'].split(',')
+        if len(languages) > 1:
+            for language in languages:
+                self.by_language[language] = SubtitleList(self.sub_path,
+                                                          self.file_name,
+                                                          language)
+        self.search_failed = False
+        self.queries = 0
 
     @property
     def sub_path(self):
@@ -86,8 +116,45 @@ class Video(object):
 
         return path
 
+    @property
+    def ep_info(self):
+        """
+        Episode information parsed from file path. Parsed only once
+        per instance, and only when it's needed, so videos that already
+        have subtitles are never parsed.
+
+        Returns:
+            dict with information found by guessit
+        """
+        if self._ep_info is None:
+            self._ep_info = guess_episode_info(self.file_path)
+        return self._ep_info
+
     @property
     def file_hash(self):
+        """
+        Hash for video file. Calculated only once per instance,
+        and only if it's not found in hash_cache.
+
+        Returns:
+            String containing file hash or None if the file
+            is not found or is too small (<128kb)
+        """
+        if self._file_hash is None and self.file_size >= 65536 * 2:
+            if self.hash_cache:
+                self._file_hash = self.hash_cache.get(self.file_path,
+                                                      self.file_stat)
+                default_metrics.count('hash_cache_hits'
+                                      if self._file_hash else
+                                      'hash_cache_misses')
+            if self._file_hash is None:
+                self._file_hash = self.calculate_hash()
+                if self._file_hash and self.hash_cache:
+                    self.hash_cache.set(self.file_path, self._file_hash,
+                                        self.file_stat)
+        return self._file_hash
+
+    def calculate_hash(self):
         """
         Calculates hash for video file if the file is larger
         than 128kb.
@@ -96,36 +163,22 @@ class Video(object):
             String containing file hash or None if the file
             is not found or is too small (<128kb)
         """
-        if self.file_size < 65536 * 2:
-            return None
-        try:
-            longlongformat = 'q'  # long long
-            bytesize = struct.calcsize(longlongformat)
-
-            with open(self.file_path, "rb") as in_file:
-
-                file_hash = self.file_size
-
-                for _ in range(65536 / bytesize):
-                    file_buffer = in_file.read(bytesize)
-                    (l_value,) = struct.unpack(longlongformat, file_buffer)
-                    file_hash += l_value
-                    file_hash &= 0xFFFFFFFFFFFFFFFF
-                    # to remain as 64bit number
-
-                in_file.seek(max(0, self.file_size - 65536), 0)
-                for _ in range(65536 / bytesize):
-                    file_buffer = in_file.read(bytesize)
-                    (l_value,) = struct.unpack(longlongformat, file_buffer)
-                    file_hash += l_value
-                    file_hash &= 0xFFFFFFFFFFFFFFFF
-                return "%016x" % file_hash
-
-        except IOError:
-            return None
+        return hash_file(self.file_path, self.file_size)
 
     @property
     def sub_exists(self):
+        """
+        Check if subtitles exist for every language searched for,
+        see sub_exists_in
+
+        Returns:
+            True if all subtitles exist, False otherwise
+        """
+        with default_metrics.timer('sub_exists'):
+            return all(self.sub_exists_in(language)
+                       for language, _ in self.subtitle_lists())
+
+    def sub_exists_in(self, language=None):
         """
         This script will download subtitles as
         original_filename.original_extension.subtitle_extension
@@ -135,23 +188,39 @@ class Video(object):
         type_1 is naming this script uses
         type_2 is naming without original file extension
 
+        When more than one language is searched for the language code
+        is added before subtitle extension, e.g. video.mkv.eng.srt
+
+        Args:
+            language: str, ISO 639-2 code subtitle is named with or None
+
         Returns:
             True if subtitle exists in same path, False otherwise
             Only subtitle extensions specified in CONFIG are checked.
         """
         possible_filenames = [self.file_name,  # video_filename.ext.sub_ext
-                              "".join(self.file_name.split('.')[:-1])  # video_filename.sub_ext
+                              os.path.splitext(self.file_name)[0]  # video_filename.sub_ext
                               ]
+        if language:
+            possible_filenames = ["{}.{}".format(name, language)
+                                  for name in possible_filenames]
         possible_folders = [self.sub_path,  # same folder as video
                             "{}{}{}".format(self.sub_path, "Subs", os.sep)  # Subs folder
                             ]
 
-        for sub_format in self.config['sub_ext']:
-            for name in possible_filenames:
-                for folder in possible_folders:
-                    if os.path.exists("{}{}{}".format(folder, name.decode('utf-8').encode('utf-8'), sub_format)):
-                        return True
-        return False
+        return any(self.sub_index.exists(folder, possible_filenames)
+                   for folder in possible_folders)
+
+    def subtitle_lists(self):
+        """
+        Subtitles found for every language searched for
+
+        Returns:
+            list of tuples of language code and SubtitleList, with
+            only one language the code is None since it's not part
+            of subtitle file names
+        """
+        return list(self.by_language.items()) or [(None, self.subtitles)]
 
     @property
     def file_search_query(self):
@@ -185,93 +254,91 @@ class Video(object):
             None if file hash can't be calculated,
             otherwise query based on hash and filesize is returned
         """
-        if self.file_hash:
+        file_hash = self.file_hash
+        if file_hash:
             return [{"sublanguageid": self.config['lang'],
-                     'moviehash'    : self.file_hash,
+                     'moviehash'    : file_hash,
                      'moviebytesize': str(self.file_size)}]
 
         return None
 
     def parse_response(self, full_json):
         """
-        Parses response for query from server. And constructs
-        multiple Subtitle instances for every subtitle found in
-        the json response.
+        Parses response for query from server. And adds every
+        subtitle found in the json response to subtitles, Subtitle
+        instances are created when they are needed.
 
         Args:
             full_json: Complete json response from XMLRPC server
-                       including all subtitles
+                       including all subtitles, None if query failed
         """
-        if not full_json or not full_json['data']:
+        self.queries += 1
+        if full_json is None:
+            self.search_failed = True
             return
 
-        for subtitle_json in full_json['data']:
-            self.subtitles.append(Subtitle(subtitle_json,
-                                           self.sub_path,
-                                           self.file_name))
+        if not full_json['data']:
+            return
+
+        self.subtitles.extend(full_json['data'])
+        for language, subtitles in self.by_language.items():
+            subtitles.extend(row for row in full_json['data']
+                             if row.get('SubLanguageID') == language)
+
+    def best_subtitle(self, subtitles=None):
+        """
+        Choose best subtitle based on how similar the subtitle and
+        video file names are or based on the type of match, see Ranker
+
+        Args:
+            subtitles: SubtitleList to choose from, by default all
+                       subtitles found for this video
+
+        Returns:
+            Candidate with the best subtitle, or None if no
+            suitable subtitle is found
+        """
+        if subtitles is None:
+            subtitles = self.subtitles
+        ranked = Ranker(self.ep_info, self.config['cutoff']).rank(
+            subtitles, stop_count=self.config['auto_stop_count'])
+        return ranked[0] if ranked else None
+
+    def download(self, subtitle, quiet=False):
+        """
+        Download subtitle and record it in sub_index
+
+        Args:
+            subtitle: Subtitle of this video
+            quiet: bool, see Subtitle.download
+
+        Returns:
+            True if subtitle was downloaded, False otherwise
+        """
+        downloaded = subtitle.download(quiet=quiet)
+        if downloaded:
+            self.sub_index.add(subtitle.full_path)
+        return downloaded
 
-    def auto_download(self):
+    def auto_download(self, subtitles=None):
         """
-        Automatically choose best subtitle based on
-        how similar the subtitle and video file names are
-        or based on the type of match.
+        Automatically download the best subtitle, see best_subtitle
+
+        Args:
+            subtitles: SubtitleList to choose from, by default all
+                       subtitles found for this video
 
         Returns:
-            True if suitable subtitle is found else False
+            None if no suitable subtitle is found, otherwise True if
+            it was downloaded and False if download failed
 
         """
-        sequence = difflib.SequenceMatcher(None, "", "")
-        possible_matches = []
-        best_choice = None
-
-        for subtitle in self.subtitles:
-
-            sub_info = guessit.guess_episode_info(subtitle.sub_filename)
-
-            sub_series = sub_info.get('series', "None Found").lower().encode('utf-8')
-            sub_season = sub_info.get('season', None)
-            sub_episode = sub_info.get('episodeNumber', None)
-
-            vid_series = self.ep_info.get('series', "None").lower().encode('utf-8')
-            vid_season = self.ep_info.get('season', None)
-            vid_episode = self.ep_info.get('episodeNumber', None)
-
-            if vid_series == sub_series:
-                if sub_season and vid_season and sub_episode and vid_episode:
-                    if [sub_season, sub_episode] == [vid_season, vid_episode]:
-                        possible_matches.append(subtitle)
-                    else:
-                        continue
-
-            subtitle_title_name = re.sub(r'[^a-zA-Z0-9\s+]', '',
-                                         subtitle.movie_name).lower()
-            episode_title_name = "{} {}".format(
-                self.ep_info.get('series', "0").lower().encode('utf-8'),
-                self.ep_info.get('title', "0").lower().encode('utf-8')
-            )
-
-            sequence.set_seqs(subtitle_title_name, episode_title_name)
-            if sequence.ratio() > self.config['cutoff']:
-                possible_matches.append(subtitle)
-                continue
-
-            if subtitle.synced:
-                possible_matches.append(subtitle)
-
-        for sub in possible_matches:
-            if not best_choice:
-                best_choice = sub
-            elif sub.download_count > best_choice.download_count:
-                if best_choice.synced and sub.synced is False:
-                    continue
-                else:
-                    best_choice = sub
-
-        if best_choice:
-            best_choice.download()
-            return True
-        else:
-            return False
+        with default_metrics.timer('auto_download'):
+            best = self.best_subtitle(subtitles)
+            if best:
+                return self.download(best.subtitle)
+            else:
+                return None
 
     def __repr__(self):
         """
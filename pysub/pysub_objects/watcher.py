@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2016 Nikola Kovacevic <nikolak@outlook.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import errno
+import struct
+import select
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_event = struct.Struct("iIII")
+
+
+def _load_inotify():
+    """
+    Load inotify functions from libc
+
+    Returns:
+        ctypes library with inotify_init1 and inotify_add_watch,
+        or None if inotify isn't available on this system
+    """
+    # ctypes is only loaded when folders are watched
+    import ctypes.util
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                           ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError, TypeError):
+        return None
+
+
+class PollingBackend(object):
+    """Finds new and changed files by listing watched folders
+
+    Attributes:
+        interval: float, seconds between folder listings
+
+    """
+
+    def __init__(self, interval=2.0):
+        """
+        Args:
+            interval: float, seconds between folder listings
+        """
+        self.interval = interval
+        self._folders = set()
+        self._known = {}
+
+    def add(self, folder):
+        """
+        Watch folder, files already in it aren't reported
+
+        Args:
+            folder: str, absolute path of folder
+        """
+        self._folders.add(folder)
+        self._list(folder)
+
+    def _list(self, folder):
+        changed = []
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            return changed, []
+
+        folders = []
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    folders.append(entry.path)
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            key = (stat.st_size, stat.st_mtime_ns)
+            if self._known.get(entry.path) != key:
+                self._known[entry.path] = key
+                changed.append(entry.path)
+        return changed, folders
+
+    def changes(self, timeout):
+        """
+        Wait for timeout, or interval if shorter, and list watched folders
+
+        Args:
+            timeout: float, maximum seconds to wait
+
+        Returns:
+            tuple of lists of changed file paths and of new folders
+        """
+        time.sleep(min(timeout, self.interval))
+        changed = []
+        new_folders = []
+        for folder in list(self._folders):
+            files, folders = self._list(folder)
+            changed += files
+            new_folders += [path for path in folders
+                            if path not in self._folders]
+        return changed, new_folders
+
+    def close(self):
+        pass
+
+
+class InotifyBackend(object):
+    """Finds new and changed files with Linux inotify
+
+    Raises:
+        OSError: if inotify isn't available
+    """
+    mask = IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO
+
+    def __init__(self):
+        self._libc = _load_inotify()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            import ctypes
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._watches = {}
+
+    def add(self, folder):
+        """
+        Watch folder
+
+        Args:
+            folder: str, absolute path of folder
+
+        Raises:
+            OSError: if folder can't be watched, e.g. watch limit is reached
+        """
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder),
+                                          self.mask)
+        if wd < 0:
+            import ctypes
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), folder)
+        self._watches[wd] = folder
+
+    @property
+    def folders(self):
+        """
+        List of watched folder paths
+        """
+        return list(self._watches.values())
+
+    def changes(self, timeout):
+        """
+        Wait up to timeout seconds for file system events
+
+        Args:
+            timeout: float, maximum seconds to wait
+
+        Returns:
+            tuple of lists of changed file paths and of new folders
+        """
+        changed = []
+        new_folders = []
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return changed, new_folders
+
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return changed, new_folders
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _event.unpack_from(data, offset)
+            offset += _event.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            # on IN_Q_OVERFLOW events were dropped, videos missed
+            # are found by the next run without watching
+            folder = self._watches.get(wd)
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                new_folders.append(path)
+            else:
+                changed.append(path)
+        return changed, new_folders
+
+    def close(self):
+        os.close(self._fd)
+
+
+class Watcher(object):
+    """Finds video files added to watched folders
+
+    New and changed files are reported by inotify, or by listing
+    the folders every interval seconds where it isn't available.
+    A file is ready once its size hasn't changed for settle seconds,
+    so files still being copied or downloaded aren't picked up.
+
+    Attributes:
+        file_ext: list of video file extensions
+        settle: float, seconds file size must stay the same
+        recursive: bool, subfolders are watched too
+        backend: InotifyBackend or PollingBackend instance
+
+    """
+
+    def __init__(self, file_ext, settle=5.0, interval=2.0, recursive=False,
+                 use_inotify=True):
+        """
+        Args:
+            file_ext: list of video file extensions
+            settle: float, seconds file size must stay the same
+            interval: float, seconds between folder listings when
+                      inotify isn't used
+            recursive: bool, watch subfolders too
+            use_inotify: bool, use inotify if it's available
+        """
+        self.file_ext = tuple(ext.lower() for ext in file_ext)
+        self.settle = settle
+        self.interval = interval
+        self.recursive = recursive
+        self.backend = None
+        if use_inotify:
+            try:
+                self.backend = InotifyBackend()
+            except OSError:
+                pass
+        if self.backend is None:
+            self.backend = PollingBackend(interval)
+        self._pending = {}
+
+    def add(self, folder):
+        """
+        Watch folder, and its subfolders if recursive is set. Videos
+        already in it aren't reported.
+
+        Args:
+            folder: str, path of folder
+        """
+        self._add(os.path.abspath(folder), report=False)
+
+    def _add(self, folder, report):
+        try:
+            self.backend.add(folder)
+        except OSError as err:
+            if isinstance(self.backend, PollingBackend):
+                print("Can't watch {}. {}".format(folder, err))
+                return
+            # e.g. inotify watch limit reached, poll everything instead
+            print("Can't watch {} with inotify, polling instead. "
+                  "{}".format(folder, err))
+            folders = self.backend.folders + [folder]
+            # files changed since the last check would be seen as
+            # already known by polling
+            changed, _ = self.backend.changes(0)
+            self.backend.close()
+            self.backend = PollingBackend(self.interval)
+            for path in folders:
+                self.backend.add(path)
+            self.retry(changed)
+
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir() and self.recursive:
+                self._add(entry.path, report)
+            elif report:
+                # folder was created or moved in after watching started
+                self.retry([entry.path])
+
+    def retry(self, file_paths):
+        """
+        Report videos again once they're ready, e.g. when they
+        couldn't be searched for
+
+        Args:
+            file_paths: list of video file paths
+        """
+        for file_path in file_paths:
+            if file_path.lower().endswith(self.file_ext):
+                self._pending.setdefault(file_path, (None, 0))
+
+    def ready(self, now=None):
+        """
+        Videos whose size hasn't changed for settle seconds, they
+        aren't reported again unless they change
+
+        Args:
+            now: float, current time.monotonic()
+
+        Returns:
+            sorted list of video file paths
+        """
+        now = time.monotonic() if now is None else now
+        ready = []
+        for file_path, (size, since) in list(self._pending.items()):
+            try:
+                current = os.stat(file_path).st_size
+            except OSError:
+                del self._pending[file_path]
+                continue
+
+            if current != size:
+                self._pending[file_path] = (current, now)
+            elif now - since >= self.settle:
+                del self._pending[file_path]
+                ready.append(file_path)
+        return sorted(ready)
+
+    def watch(self):
+        """
+        Wait for new videos
+
+        Yields:
+            list of video file paths that are ready, see ready
+        """
+        while True:
+            timeout = min(self.settle, self.interval) if self._pending \
+                else 60
+            changed, new_folders = self.backend.changes(timeout)
+            self.retry(changed)
+            for folder in new_folders:
+                if self.recursive:
+                    self._add(folder, report=True)
+
+            ready = self.ready()
+            if ready:
+                yield ready
+
+    def close(self):
+        """
+        Stop watching all folders
+        """
+        self.backend.close()
+
+    def __repr__(self):
+        return "<Watcher {} pending>".format(len(self._pending))
@@ -27,6 +27,11 @@ from appdirs import AppDirs
 
 dirs = AppDirs("pysub", "pysub")
 config_file = dirs.user_data_dir + os.sep + "config.json"
+hash_cache_file = dirs.user_data_dir + os.sep + "hashes.db"
+directory_cache_file = dirs.user_data_dir + os.sep + "directories.db"
+search_cache_file = dirs.user_data_dir + os.sep + "searches.db"
+parse_cache_file = dirs.user_data_dir + os.sep + "guesses.db"
+journal_file = dirs.user_data_dir + os.sep + "journal.db"
 
 default_config = {
     "file_ext": [
@@ -52,6 +57,35 @@ default_config = {
     "not_found_prompt": False,
     "subfolder": None,
     "cutoff": 0.75,
+    "auto_stop_count": 0,
+    "jobs": 1,
+    "batch_size": 10,
+    "query_strategy": "both",
+    "hash_cache": True,
+    "hash_jobs": 1,
+    "hash_per_device": 2,
+    "hash_processes": False,
+    "skip_unchanged": False,
+    "search_cache": True,
+    "search_ttl": 7 * 24 * 3600,
+    "search_negative_ttl": 24 * 3600,
+    "search_cache_size": 100000,
+    "refresh": False,
+    "parse_cache": True,
+    "pool_size": 4,
+    "timeout": 30,
+    "rate_limit": 4.0,
+    "rate_burst": 4,
+    "journal": True,
+    "journal_ttl": 30 * 24 * 3600,
+    "resume": False,
+    "watch_settle": 5,
+    "watch_interval": 2,
+    "metrics_file": None,
+    "store": None,
+    "shards": 1,
+    "shard": None,
+    "shard_by": "path",
 
     "lang": "eng",
     "lang_name": "English",
@@ -22,18 +22,129 @@ test_pysub
 Tests for `pysub` module.
 """
 
+import io
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import random
+import shutil
+import asyncio
+import difflib
+import tempfile
 import unittest
+import threading
+import subprocess
+import http.client
+import http.server
+import socketserver
+import xmlrpc.client
+import xmlrpc.server
+from unittest import mock
 
 from pysub import pysub
+from pysub.pysub_objects import (HashCache, DirectoryCache, SearchCache,
+                                 ParseCache, JobJournal, Scanner,
+                                 SubtitleIndex, hash_file, hash_files,
+                                 guess_episode_info,
+                                 use_parse_cache, Ranker, Subtitle,
+                                 SubtitleList, QueryPlanner, RateLimiter,
+                                 OpenSubtitlesServer, Watcher, Video,
+                                 Metrics, FileResult, HashRing, shard_key,
+                                 partition, SQLiteStore, SharedSearchCache,
+                                 ConnectionPool, AsyncOpenSubtitlesServer,
+                                 SharedStore)
+from pysub.pysub_objects.ratelimit import status_code
+from pysub.pysub_objects.rpc import PooledTransport
+from pysub.pysub_objects import ranking
+
+
+def parse_name(name):
+    """
+    Small stand in for guessit used to keep ranking tests deterministic
+    """
+    match = re.match(r'(.+?)\.S(\d+)E(\d+)\.?(.*?)\.\w+$', name)
+    if not match:
+        return {}
+    info = {'series': match.group(1).replace('.', ' '),
+            'season': int(match.group(2)),
+            'episodeNumber': int(match.group(3))}
+    if match.group(4):
+        info['title'] = match.group(4).replace('.', ' ')
+    return info
 
 
 class TestPysubVideo(unittest.TestCase):
 
     def setUp(self):
-        pass
+        self.folder = tempfile.mkdtemp()
+        self.video_path = os.path.join(self.folder, "Show.S01E02.mkv")
+        with open(self.video_path, "wb") as video:
+            video.write(b"\0" * 1024)
+        self.config = dict(pysub.config, lang="eng,spa", subfolder=None)
 
     def tearDown(self):
-        pass
+        shutil.rmtree(self.folder)
+
+    def test_languages_split(self):
+        video = Video(self.video_path, self.config)
+        video.parse_response({'status': '200 OK', 'data': [
+            {'IDSubtitleFile': '1', 'SubLanguageID': 'eng',
+             'SubFormat': 'srt'},
+            {'IDSubtitleFile': '2', 'SubLanguageID': 'spa',
+             'SubFormat': 'srt'},
+            {'IDSubtitleFile': '3', 'SubLanguageID': 'spa',
+             'SubFormat': 'srt'}]})
+        self.assertEqual(len(video.subtitles), 3)
+        lists = dict(video.subtitle_lists())
+        self.assertEqual([subtitle.sub_id for subtitle in lists['spa']],
+                         ['2', '3'])
+        self.assertEqual(lists['eng'][0].full_path,
+                         self.video_path + ".eng.srt")
+
+    def test_sub_exists_in(self):
+        with open(os.path.join(self.folder, "Show.S01E02.eng.srt"), "w"):
+            pass
+        video = Video(self.video_path, self.config)
+        self.assertTrue(video.sub_exists_in('eng'))
+        self.assertFalse(video.sub_exists_in('spa'))
+        self.assertFalse(video.sub_exists)
+
+    def test_ep_info_parsed_when_needed(self):
+        with mock.patch("pysub.pysub_objects.video.guess_episode_info",
+                        return_value={'series': 'Show'}) as guess:
+            video = Video(self.video_path, self.config)
+            self.assertFalse(video.sub_exists)
+            self.assertEqual(guess.call_count, 0)
+            self.assertEqual(video.ep_info['series'], 'Show')
+            video.ep_info
+            self.assertEqual(guess.call_count, 1)
+
+
+class TestPysubStartup(unittest.TestCase):
+
+    def test_lazy_imports(self):
+        # run in a new interpreter, this one has everything imported
+        code = ("import sys, time; start = time.perf_counter(); "
+                "from pysub import pysub; "
+                "print(time.perf_counter() - start); "
+                "print(' '.join(sorted(sys.modules)))")
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+            [path for path in [env.get('PYTHONPATH')] if path])
+        seconds, modules = subprocess.check_output(
+            [sys.executable, "-c", code], env=env).decode().split("\n", 1)
+        modules = modules.split()
+        for module in ("guessit", "asyncio", "xmlrpc.client", "http.client",
+                       "urllib.request", "gzip", "difflib", "ctypes",
+                       "multiprocessing", "cProfile"):
+            self.assertNotIn(module, modules)
+        # loose bound for slow machines, modules above are the exact check
+        self.assertLess(float(seconds), 1.0)
+
 
 class TestPysubServer(unittest.TestCase):
 
@@ -43,5 +154,1222 @@ class TestPysubServer(unittest.TestCase):
     def tearDown(self):
         pass
 
+    def test_keep_alive_expired(self):
+        server = OpenSubtitlesServer("http://localhost", "ua", "eng",
+                                     limiter=RateLimiter(rate=0))
+        server.token = "expired"
+        proxy = mock.Mock()
+        proxy.NoOperation.return_value = {'status': "406 No session"}
+        proxy.LogIn.return_value = {'status': "200 OK", 'token': "new"}
+        with mock.patch.object(OpenSubtitlesServer, 'server', proxy):
+            self.assertTrue(server.keep_alive())
+        self.assertEqual(server.token, "new")
+
+    def batch_query(self, queries, response):
+        server = OpenSubtitlesServer("http://localhost", "ua", "eng",
+                                     limiter=RateLimiter(rate=0))
+        with mock.patch.object(server, 'query', return_value=response):
+            return server.batch_query(queries)
+
+    def test_batch_query_split(self):
+        queries = [{'moviehash': 'abc', 'moviebytesize': '1'},
+                   {'query': 'Show', 'season': 1, 'episode': 2},
+                   {'moviehash': 'def', 'moviebytesize': '2'}]
+        response = {'status': '200 OK', 'data': [
+            {'IDSubtitleFile': '1', 'QueryNumber': '1'},
+            {'IDSubtitleFile': '2', 'QueryNumber': '0'},
+            {'IDSubtitleFile': '3', 'QueryNumber': '2'},
+            {'IDSubtitleFile': '4', 'QueryNumber': '1'}]}
+        responses = self.batch_query(queries, response)
+        self.assertEqual([[sub['IDSubtitleFile'] for sub in res['data']]
+                          for res in responses], [['2'], ['1', '4'], ['3']])
+
+    def test_batch_query_missing_number(self):
+        queries = [{'query': 'Show', 'season': 1, 'episode': 2},
+                   {'moviehash': 'abc', 'moviebytesize': '1'}]
+        response = {'status': '200 OK', 'data': [
+            {'IDSubtitleFile': '1', 'MovieHash': 'abc'},
+            {'IDSubtitleFile': '2', 'MovieHash': 'unknown'},
+            {'IDSubtitleFile': '3', 'QueryNumber': '7'}]}
+        responses = self.batch_query(queries, response)
+        self.assertEqual(responses[0]['data'], [])
+        self.assertEqual([sub['IDSubtitleFile']
+                          for sub in responses[1]['data']], ['1'])
+
+    def test_batch_query_empty(self):
+        queries = [{'moviehash': 'abc', 'moviebytesize': '1'},
+                   {'query': 'Show', 'season': 1, 'episode': 2}]
+        responses = self.batch_query(queries, {'status': '200 OK',
+                                               'data': False})
+        self.assertEqual(responses, [{'status': '200 OK', 'data': []}] * 2)
+        self.assertEqual(self.batch_query(queries, None), [None, None])
+
+
+class TestPysubAsyncServer(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.server = AsyncOpenSubtitlesServer("http://localhost", "ua",
+                                               "eng",
+                                               limiter=RateLimiter(rate=0),
+                                               concurrency=2)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_login(self):
+        with mock.patch.object(self.server.sync_server, 'call',
+                               return_value={'status': '200 OK',
+                                             'token': 'abc'}) as call:
+            self.loop.run_until_complete(self.server.login())
+        self.assertTrue(self.server.logged_in)
+        self.assertEqual(self.server.token, 'abc')
+        self.assertEqual(call.call_args[0][:4], ('LogIn', '', '', 'eng'))
+
+    def test_concurrency(self):
+        lock = threading.Lock()
+        calls = [0, 0]  # running now, most running at once
+
+        def query(query, **kwargs):
+            with lock:
+                calls[0] += 1
+                calls[1] = max(calls[1], calls[0])
+            time.sleep(0.02)
+            with lock:
+                calls[0] -= 1
+            return {'status': '200 OK', 'data': query}
+
+        async def search():
+            return await asyncio.gather(*[self.server.query(num)
+                                          for num in range(6)])
+
+        with mock.patch.object(self.server.sync_server, 'query', query):
+            results = self.loop.run_until_complete(search())
+        self.assertEqual([result['data'] for result in results],
+                         list(range(6)))
+        self.assertEqual(calls[1], 2)
+
+    def test_download(self):
+        subtitle = mock.Mock()
+        subtitle.download.return_value = True
+        self.assertTrue(self.loop.run_until_complete(
+            self.server.download(subtitle, quiet=True)))
+        subtitle.download.assert_called_once_with(
+            self.server.sync_server.pool,
+            limiter=self.server.sync_server.limiter, quiet=True)
+
+    def test_download_async(self):
+        subtitle = Subtitle({'SubFormat': 'srt'}, os.sep, "video.mkv")
+        with mock.patch.object(Subtitle, 'download',
+                               return_value=True) as download:
+            self.assertTrue(self.loop.run_until_complete(
+                subtitle.download_async(quiet=True)))
+        download.assert_called_once_with(None, limiter=None, quiet=True)
+
+
+class TestPysubHashCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.video_path = os.path.join(self.folder, "video.mkv")
+        with open(self.video_path, "wb") as video:
+            video.write(b"\0" * 1024)
+        self.cache = HashCache(os.path.join(self.folder, "hashes.db"))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.folder)
+
+    def test_get_missing(self):
+        self.assertIsNone(self.cache.get(self.video_path))
+
+    def test_set_get(self):
+        self.cache.set(self.video_path, "0123456789abcdef")
+        self.assertEqual(self.cache.get(self.video_path), "0123456789abcdef")
+
+    def test_changed_file(self):
+        self.cache.set(self.video_path, "0123456789abcdef")
+        with open(self.video_path, "ab") as video:
+            video.write(b"\0")
+        self.assertIsNone(self.cache.get(self.video_path))
+
+    def test_persisted(self):
+        self.cache.set(self.video_path, "0123456789abcdef")
+        self.cache.close()
+        self.cache = HashCache(self.cache.path)
+        self.assertEqual(self.cache.get(self.video_path), "0123456789abcdef")
+
+
+class TestPysubJobJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.video_path = os.path.join(self.folder, "video.mkv")
+        with open(self.video_path, "wb") as video:
+            video.write(b"\0" * 1024)
+        self.journal = JobJournal(os.path.join(self.folder, "journal.db"))
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.folder)
+
+    def test_hash_kept(self):
+        self.journal.set(self.video_path, JobJournal.HASHED,
+                         "0123456789abcdef")
+        self.journal.set(self.video_path, JobJournal.NO_RESULTS)
+        self.assertEqual(self.journal.get(self.video_path),
+                         (JobJournal.NO_RESULTS, "0123456789abcdef"))
+
+    def test_finished(self):
+        self.journal.set(self.video_path, JobJournal.FAILED)
+        self.assertFalse(self.journal.finished(self.video_path))
+        self.journal.set(self.video_path, JobJournal.DOWNLOADED)
+        self.assertTrue(self.journal.finished(self.video_path))
+        self.assertFalse(self.journal.finished(self.video_path + ".missing"))
+
+    def test_resume_jobs(self):
+        other_path = os.path.join(self.folder, "other.mkv")
+        with open(other_path, "wb") as video:
+            video.write(b"\0" * 2048)
+        self.journal.set(self.video_path, JobJournal.SKIPPED)
+        self.journal.set(other_path, JobJournal.HASHED, "0123456789abcdef")
+        self.journal.close()
+        self.journal = JobJournal(self.journal.path)
+        with mock.patch('builtins.print'):
+            remaining, hashes = pysub.resume_jobs(
+                [self.video_path, other_path], self.journal)
+        self.assertEqual(remaining, [other_path])
+        self.assertEqual(hashes, {other_path: "0123456789abcdef"})
+
+    def test_languages(self):
+        self.journal.set(self.video_path, JobJournal.HASHED,
+                         "0123456789abcdef")
+        self.journal.set(self.video_path, JobJournal.NO_RESULTS)
+        self.journal.close()
+        self.journal = JobJournal(self.journal.path, languages="spa,eng")
+        self.assertFalse(self.journal.finished(self.video_path))
+        self.assertEqual(self.journal.get(self.video_path),
+                         (None, "0123456789abcdef"))
+        self.journal.set(self.video_path, JobJournal.DOWNLOADED)
+        self.journal.close()
+        self.journal = JobJournal(self.journal.path, languages="eng,spa")
+        self.assertTrue(self.journal.finished(self.video_path))
+
+
+class TestPysubSearchCache(unittest.TestCase):
+
+    query = {'sublanguageid': 'eng', 'moviehash': 'ABC',
+             'moviebytesize': '1000'}
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "searches.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_get_set(self):
+        cache = SearchCache(self.path)
+        self.assertIsNone(cache.get(self.query))
+        cache.set(self.query, [{'IDSubtitleFile': '1'}])
+        normalized = dict(self.query, moviehash='abc')
+        self.assertEqual(cache.get(normalized), [{'IDSubtitleFile': '1'}])
+        cache.close()
+
+    def test_ttl(self):
+        cache = SearchCache(self.path, ttl=-1, negative_ttl=3600)
+        cache.set(self.query, [{'IDSubtitleFile': '1'}])
+        self.assertIsNone(cache.get(self.query))
+        cache.set(self.query, [])
+        self.assertEqual(cache.get(self.query), [])
+        cache.close()
+
+    def test_refresh(self):
+        cache = SearchCache(self.path, refresh=True)
+        cache.set(self.query, [])
+        self.assertIsNone(cache.get(self.query))
+        cache.close()
+
+    def test_max_entries(self):
+        cache = SearchCache(self.path, max_entries=1)
+        cache.set(self.query, [])
+        cache.set(dict(self.query, moviehash='def'), [])
+        cache.close()
+        cache = SearchCache(self.path)
+        self.assertIsNone(cache.get(self.query))
+        self.assertEqual(cache.get(dict(self.query, moviehash='def')), [])
+        cache.close()
+
+    def test_max_entries_while_running(self):
+        cache = SearchCache(self.path, max_entries=2, clean_every=2)
+        for num in range(5):
+            cache.set(dict(self.query, moviehash=str(num)), [])
+        count = cache._fetch("SELECT COUNT(*) FROM searches")[0]
+        self.assertEqual(count, 3)
+        self.assertIsNone(cache.get(dict(self.query, moviehash='0')))
+        self.assertEqual(cache.get(dict(self.query, moviehash='4')), [])
+        cache.close()
+
+
+class TestPysubParsing(unittest.TestCase):
+
+    name = "Show.Name.S01E02.Title.720p.mkv"
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        # stand in for guessit module, only parsing layer is tested
+        self.guessit = mock.Mock(return_value={'series': 'Show Name',
+                                               'season': 1,
+                                               'episodeNumber': 2})
+        self.guess = mock.patch.dict(sys.modules, {'guessit': mock.Mock(
+            __version__='0.0', guess_episode_info=self.guessit)})
+        self.guess.start()
+        use_parse_cache(None)
+
+    def tearDown(self):
+        self.guess.stop()
+        use_parse_cache(None)
+        shutil.rmtree(self.folder)
+
+    def test_memoized(self):
+        self.assertEqual(guess_episode_info(self.name)['episodeNumber'], 2)
+        guess_episode_info(self.name)['season'] = 5
+        self.assertEqual(guess_episode_info(self.name)['season'], 1)
+        self.assertEqual(self.guessit.call_count, 1)
+
+    def test_parse_cache(self):
+        cache = ParseCache(os.path.join(self.folder, "guesses.db"))
+        use_parse_cache(cache)
+        guess_episode_info(self.name)
+        use_parse_cache(cache)
+        self.assertEqual(guess_episode_info(self.name)['series'], 'Show Name')
+        self.assertEqual(self.guessit.call_count, 1)
+        cache.close()
+
+
+class TestPysubRanking(unittest.TestCase):
+
+    series = ["Show Name", "Other Show", "Show", "Name Show"]
+    titles = ["Pilot", "The Return", "Finale", ""]
+
+    def setUp(self):
+        self.guess = mock.patch.object(ranking, "guess_episode_info",
+                                       side_effect=parse_name)
+        self.guess.start()
+        self.random = random.Random(1)
+
+    def tearDown(self):
+        self.guess.stop()
+
+    def file_name(self, extension):
+        name = "{}.S{:02d}E{:02d}.{}.{}".format(
+            self.random.choice(self.series).replace(' ', '.'),
+            self.random.randint(1, 2), self.random.randint(1, 3),
+            self.random.choice(self.titles), extension)
+        return name.replace("..", ".")
+
+    def subtitle(self):
+        series = self.random.choice(self.series)
+        return Subtitle({'MatchedBy': self.random.choice(["moviehash",
+                                                          "fulltext"]),
+                         'MovieName': '"{}" {}'.format(
+                             series, self.random.choice(self.titles)),
+                         'SubDownloadsCnt': str(self.random.randint(0, 50)),
+                         'SubFormat': 'srt',
+                         'SubFileName': self.file_name("srt")},
+                        os.sep, "video.mkv")
+
+    @staticmethod
+    def legacy_choice(ep_info, subtitles, cutoff):
+        """
+        Choice made by Video.auto_download before Ranker was added
+        """
+        sequence = difflib.SequenceMatcher(None, "", "")
+        possible_matches = []
+        best_choice = None
+
+        for subtitle in subtitles:
+            sub_info = parse_name(subtitle.sub_filename)
+            sub_series = sub_info.get('series', "None Found").lower()
+            sub_season = sub_info.get('season', None)
+            sub_episode = sub_info.get('episodeNumber', None)
+            vid_series = ep_info.get('series', "None").lower()
+            vid_season = ep_info.get('season', None)
+            vid_episode = ep_info.get('episodeNumber', None)
+
+            if vid_series == sub_series:
+                if sub_season and vid_season and sub_episode and vid_episode:
+                    if [sub_season, sub_episode] == [vid_season, vid_episode]:
+                        possible_matches.append(subtitle)
+                    else:
+                        continue
+
+            subtitle_title_name = re.sub(r'[^a-zA-Z0-9\s+]', '',
+                                         subtitle.movie_name).lower()
+            episode_title_name = "{} {}".format(
+                ep_info.get('series', "0").lower(),
+                ep_info.get('title', "0").lower())
+
+            sequence.set_seqs(subtitle_title_name, episode_title_name)
+            if sequence.ratio() > cutoff:
+                possible_matches.append(subtitle)
+                continue
+
+            if subtitle.synced:
+                possible_matches.append(subtitle)
+
+        for sub in possible_matches:
+            if not best_choice:
+                best_choice = sub
+            elif sub.download_count > best_choice.download_count:
+                if best_choice.synced and sub.synced is False:
+                    continue
+                else:
+                    best_choice = sub
+        return best_choice
+
+    def test_same_choice_as_legacy(self):
+        for _ in range(300):
+            ep_info = parse_name(self.file_name("mkv"))
+            subtitles = [self.subtitle()
+                         for _ in range(self.random.randint(0, 30))]
+            ranked = Ranker(ep_info, 0.75).rank(subtitles)
+            best = ranked[0].subtitle if ranked else None
+            self.assertIs(best, self.legacy_choice(ep_info, subtitles, 0.75))
+
+    def test_different_episode(self):
+        ep_info = {'series': 'Show', 'season': 1, 'episodeNumber': 2}
+        subtitle = Subtitle({'MatchedBy': 'moviehash', 'MovieName': 'Show',
+                             'SubFileName': 'Show.S01E03.srt'},
+                            os.sep, "video.mkv")
+        self.assertEqual(Ranker(ep_info, 0.75).rank([subtitle]), [])
+
+
+class TestPysubSubtitleDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp() + os.sep
+        self.subtitle = Subtitle({'SubFormat': 'srt',
+                                  'SubDownloadLink': 'http://localhost/1'},
+                                 self.folder, "video.mkv")
+        self.body = gzip.compress(b"1\n00:00:01,000 --> 00:00:02,000\n" * 50)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def download(self, response):
+        request = mock.MagicMock()
+        request.__enter__.return_value = response
+        pool = mock.Mock(**{'get.return_value': request})
+        return self.subtitle.download(pool, chunk_size=64,
+                                      limiter=RateLimiter(rate=0),
+                                      quiet=True)
+
+    def test_download(self):
+        self.assertTrue(self.download(io.BytesIO(self.body)))
+        self.assertEqual(os.listdir(self.folder), ["video.mkv.srt"])
+        with open(self.subtitle.full_path, "rb") as subtitle:
+            self.assertEqual(subtitle.read(), gzip.decompress(self.body))
+
+    def test_truncated(self):
+        with open(self.subtitle.full_path, "w") as subtitle:
+            subtitle.write("previous")
+        self.assertFalse(self.download(io.BytesIO(self.body[:-20])))
+        # previous subtitle is kept and temporary file removed
+        self.assertEqual(os.listdir(self.folder), ["video.mkv.srt"])
+        with open(self.subtitle.full_path) as subtitle:
+            self.assertEqual(subtitle.read(), "previous")
+
+    def test_incomplete_read(self):
+        response = mock.Mock()
+        response.read.side_effect = [self.body[:64],
+                                     http.client.IncompleteRead(b"")]
+        self.assertFalse(self.download(response))
+        self.assertEqual(os.listdir(self.folder), [])
+
+
+class TestPysubSubtitleList(unittest.TestCase):
+
+    def test_deduplicate(self):
+        subtitles = SubtitleList(os.sep, "video.mkv")
+        subtitles.extend([{'IDSubtitleFile': '1', 'MatchedBy': 'fulltext'},
+                          {'IDSubtitleFile': '2', 'MatchedBy': 'fulltext'}])
+        subtitles.extend([{'IDSubtitleFile': '1', 'MatchedBy': 'moviehash'},
+                          {'IDSubtitleFile': '3', 'MatchedBy': 'moviehash'}])
+        self.assertEqual([subtitle.sub_id for subtitle in subtitles],
+                         ['1', '2', '3'])
+        self.assertTrue(subtitles[0].synced)
+
+    def test_lazy(self):
+        subtitles = SubtitleList(os.sep, "video.mkv")
+        subtitles.extend([{'IDSubtitleFile': '1', 'SubFormat': 'srt'}])
+        self.assertEqual(subtitles._subtitles, [None])
+        self.assertIs(subtitles[0], subtitles[0])
+        self.assertEqual(subtitles[0].full_path, os.sep + "video.mkv.srt")
+        self.assertEqual(subtitles._rows, [None])
+
+    def test_deduplicate_created(self):
+        subtitles = SubtitleList(os.sep, "video.mkv")
+        subtitles.extend([{'IDSubtitleFile': '1', 'MatchedBy': 'fulltext'},
+                          {'IDSubtitleFile': '2', 'MatchedBy': 'moviehash'}])
+        self.assertFalse(subtitles[0].synced)
+        self.assertTrue(subtitles[1].synced)
+        subtitles.extend([{'IDSubtitleFile': '1', 'MatchedBy': 'moviehash'},
+                          {'IDSubtitleFile': '2', 'MatchedBy': 'fulltext'}])
+        self.assertEqual(len(subtitles), 2)
+        self.assertTrue(subtitles[0].synced)
+        self.assertTrue(subtitles[1].synced)
+
+    def test_stop_count(self):
+        subtitles = SubtitleList(os.sep, "video.mkv")
+        subtitles.extend([{'IDSubtitleFile': str(num),
+                           'MatchedBy': 'moviehash',
+                           'SubDownloadsCnt': str(num * 100),
+                           'SubFileName': 'Show.S01E02.srt'}
+                          for num in range(1, 5)])
+        ep_info = {'series': 'Show', 'season': 1, 'episodeNumber': 2}
+        with mock.patch.object(ranking, "guess_episode_info",
+                               side_effect=parse_name):
+            ranked = Ranker(ep_info, 0.75).rank(subtitles, stop_count=200)
+        self.assertEqual(ranked[0].subtitle.sub_id, '2')
+        self.assertEqual(subtitles._subtitles[2:], [None, None])
+
+
+class TestPysubQueryPlanner(unittest.TestCase):
+
+    class Server(object):
+
+        def __init__(self, rows):
+            self.rows = rows
+            self.queries = []
+
+        def batch_query(self, queries):
+            self.queries += queries
+            return [{'status': '200 OK',
+                     'data': self.rows if 'moviehash' in query else []}
+                    for query in queries]
+
+    class Video(object):
+
+        ep_info = {'series': 'Show', 'season': 1, 'episodeNumber': 2}
+        file_search_query = [{'query': 'Show S01E02'}]
+        hash_search_query = [{'moviehash': '0123456789abcdef'}]
+
+        def __init__(self):
+            self.subtitles = SubtitleList(os.sep, "video.mkv")
+
+        def parse_response(self, response):
+            self.subtitles.extend(response['data'])
+
+        def subtitle_lists(self):
+            return [(None, self.subtitles)]
+
+    def setUp(self):
+        self.guess = mock.patch.object(ranking, "guess_episode_info",
+                                       side_effect=parse_name)
+        self.guess.start()
+
+    def tearDown(self):
+        self.guess.stop()
+
+    def search(self, strategy, sub_filename):
+        server = self.Server([{'IDSubtitleFile': '1',
+                               'MatchedBy': 'moviehash',
+                               'MovieName': 'Other',
+                               'SubFileName': sub_filename}])
+        planner = QueryPlanner(strategy)
+        planner.search(server, [self.Video()])
+        return planner, server
+
+    def test_both(self):
+        planner, server = self.search('both', 'Show.S01E02.srt')
+        self.assertEqual(len(server.queries), 2)
+        self.assertEqual(planner.saved, 0)
+
+    def test_name_only(self):
+        planner, server = self.search('name-only', 'Show.S01E02.srt')
+        self.assertEqual(server.queries, [{'query': 'Show S01E02'}])
+
+    def test_hash_first_confident(self):
+        planner, server = self.search('hash-first', 'Show.S01E02.srt')
+        self.assertEqual(server.queries, [{'moviehash': '0123456789abcdef'}])
+        self.assertEqual((planner.sent, planner.saved), (1, 1))
+
+    def test_hash_first_fallback(self):
+        planner, server = self.search('hash-first', 'Unknown.srt')
+        self.assertEqual(len(server.queries), 2)
+        self.assertEqual(planner.saved, 0)
+
+    def test_unknown_strategy(self):
+        self.assertRaises(ValueError, QueryPlanner, 'hash-only')
+
+
+class TestPysubOrderedMap(unittest.TestCase):
+
+    def test_order(self):
+        def work(item):
+            time.sleep(random.random() / 100)
+            return item * 2
+
+        self.assertEqual(list(pysub.ordered_map(work, range(20), 4)),
+                         [item * 2 for item in range(20)])
+
+    def test_cancel(self):
+        started, finished = [], []
+
+        def work(item):
+            started.append(item)
+            time.sleep(0.01)
+            finished.append(item)
+            return item
+
+        results = pysub.ordered_map(work, range(100), 2)
+        self.assertEqual(next(results), 0)
+        results.close()
+        self.assertLess(len(started), 100)
+        # work already running is finished before close returns
+        self.assertEqual(sorted(started), sorted(finished))
+        time.sleep(0.05)
+        self.assertEqual(len(started), len(finished))
+
+
+class TestPysubBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.paths = []
+        for name in ("Show.S01E02.mkv", "Show.S01E03.mkv"):
+            self.paths.append(os.path.join(self.folder, name))
+            with open(self.paths[-1], "wb") as video:
+                video.write(os.urandom(65536 * 3))
+        with open(os.path.join(self.folder, "Show.S01E03.srt"), "w"):
+            pass
+        self.config = dict(pysub.config, lang="eng", subfolder=None,
+                           overwrite=False, hash_cache=False,
+                           parse_cache=False, search_cache=False,
+                           journal=False, jobs=1, hash_jobs=1,
+                           query_strategy='both')
+        self.server = mock.Mock(logged_in=True)
+        self.server.batch_query.side_effect = lambda queries: [
+            {'status': '200 OK', 'data': [
+                {'IDSubtitleFile': '1', 'MatchedBy': 'moviehash',
+                 'SubFileName': 'Show.S01E02.srt', 'SubDownloadsCnt': '10',
+                 'SubFormat': 'srt'}] if 'moviehash' in query else []}
+            for query in queries]
+        self.patches = [
+            mock.patch("pysub.pysub_objects.video.guess_episode_info",
+                       side_effect=parse_name),
+            mock.patch.object(ranking, "guess_episode_info",
+                              side_effect=parse_name),
+            mock.patch.object(Subtitle, "download", return_value=True)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.folder)
+
+    def test_results(self):
+        results = list(pysub.run_batch(self.paths, self.config,
+                                       server=self.server))
+        self.assertEqual([result.status for result in results],
+                         [FileResult.DOWNLOADED, FileResult.EXISTS])
+        line = json.loads(results[0].to_json())
+        self.assertEqual(line['path'], self.paths[0])
+        self.assertEqual(line['subtitle_id'], '1')
+        self.assertEqual(line['score'], 1.0)
+        self.assertEqual(line['queries'], 2)
+        self.assertEqual(len(line['hash']), 16)
+        self.assertIn('search', line['timings'])
+        self.assertFalse(self.server.log_out.called)
+
+    def test_concurrent_downloads(self):
+        self.config['jobs'] = 2
+        results = list(pysub.run_batch(self.paths, self.config,
+                                       server=self.server))
+        self.assertEqual([result.path for result in results], self.paths)
+        self.assertEqual(results[0].status, FileResult.DOWNLOADED)
+        Subtitle.download.assert_called_once_with(quiet=True)
+
+    def test_auto_download_output(self):
+        self.config.update(jobs=2, auto_download=True,
+                           not_found_prompt=False)
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            pysub.search_subtitles(self.paths, self.config,
+                                   server=self.server)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines.index("Downloaded subtitle...") + 3,
+                         lines.index("Subtitle already exists"))
+
+    def test_file_removed(self):
+        # video deleted after scanning fails alone, run continues
+        os.remove(self.paths[0])
+        results = list(pysub.run_batch(self.paths, self.config,
+                                       server=self.server))
+        self.assertEqual([result.status for result in results],
+                         [FileResult.FAILED, FileResult.EXISTS])
+        self.assertEqual(results[0].path, self.paths[0])
+        self.assertTrue(results[0].error)
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            pysub.search_subtitles(self.paths, self.config,
+                                   server=self.server)
+        self.assertIn("Couldn't read {}".format(self.paths[0]),
+                      output.getvalue())
+
+    def test_download_error(self):
+        Subtitle.download.side_effect = http.client.IncompleteRead(b"")
+        results = list(pysub.run_batch(self.paths, self.config,
+                                       server=self.server))
+        self.assertEqual([result.status for result in results],
+                         [FileResult.FAILED, FileResult.EXISTS])
+
+    def test_login_failed(self):
+        self.server.logged_in = False
+        results = list(pysub.run_batch(self.paths, self.config,
+                                       server=self.server))
+        self.assertEqual(results[0].status, FileResult.FAILED)
+        self.assertTrue(results[0].error)
+        self.assertEqual(results[1].status, FileResult.EXISTS)
+
+    def test_journal_hashes(self):
+        # interrupted before searching, hash is kept for --resume
+        self.server.logged_in = False
+        self.config.update(journal=True, journal_ttl=3600)
+        journal_path = os.path.join(self.folder, "journal.db")
+        with mock.patch.object(pysub, "journal_file", journal_path):
+            results = list(pysub.run_batch(self.paths, self.config,
+                                           server=self.server))
+        journal = JobJournal(journal_path, languages="eng")
+        self.assertEqual(journal.get(self.paths[0]),
+                         (JobJournal.HASHED, results[0].file_hash))
+        with mock.patch('builtins.print'):
+            remaining, hashes = pysub.resume_jobs(self.paths, journal)
+        self.assertEqual(hashes, {self.paths[0]: results[0].file_hash})
+        journal.close()
+
+    def test_languages(self):
+        result = FileResult(self.paths[0], queries=1)
+        result.choose('eng', None, FileResult.EXISTS)
+        result.choose('spa', None, FileResult.SKIPPED)
+        self.assertEqual(result.status, FileResult.SKIPPED)
+        result.choose('fre', None, FileResult.FAILED)
+        line = result.as_dict()
+        self.assertEqual(line['status'], FileResult.FAILED)
+        self.assertIsNone(line['subtitle_id'])
+        self.assertEqual(list(line['languages']), ['eng', 'spa', 'fre'])
+
+        # not finished by --resume if another language may be found later
+        result = FileResult(self.paths[0], queries=1)
+        result.choose('eng', None, FileResult.EXISTS)
+        result.choose('spa', None, FileResult.NO_RESULTS)
+        self.assertEqual(result.status, FileResult.NO_RESULTS)
+
+    def test_quiet(self):
+        self.config.update(journal=True, journal_ttl=3600, resume=True)
+        journal_path = os.path.join(self.folder, "journal.db")
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output, \
+                mock.patch.object(pysub, "journal_file", journal_path):
+            results = list(pysub.run_batch(self.paths, self.config,
+                                           server=self.server, quiet=True))
+        self.assertEqual(len(results), 2)
+        self.assertEqual(output.getvalue(), "")
+
+
+class TestPysubHashing(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write_video(self, name, content):
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as video:
+            video.write(content)
+        return path
+
+    def test_too_small(self):
+        path = self.write_video("small.mkv", b"\0" * 65536)
+        self.assertIsNone(hash_file(path))
+
+    def test_zero_file(self):
+        path = self.write_video("zero.mkv", b"\0" * 65536 * 2)
+        self.assertEqual(hash_file(path), "0000000000020000")
+
+    def test_overflow(self):
+        path = self.write_video("ff.mkv", b"\xff" * 65536 * 3)
+        # 16384 times -1 plus file size, truncated to 64bits
+        self.assertEqual(hash_file(path), "%016x" % (65536 * 3 - 16384))
+
+    def test_hash_files(self):
+        path = self.write_video("zero.mkv", b"\0" * 65536 * 2)
+        missing = os.path.join(self.folder, "missing.mkv")
+        self.assertEqual(hash_files([path, missing]),
+                         {path: "0000000000020000", missing: None})
+
+    def test_hash_files_pool(self):
+        paths = [self.write_video("{}.mkv".format(num),
+                                  bytes([num]) * 65536 * 2)
+                 for num in range(5)]
+        self.assertEqual(hash_files(paths, jobs=3, per_device=2),
+                         hash_files(paths))
+
+
+class ThreadingServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.clients.add(self.client_address)
+        self.send_response(200)
+        self.send_header("Content-Length", "8")
+        self.end_headers()
+        self.wfile.write(b"subtitle")
+        # server drops connection without telling the client
+        self.close_connection = self.server.drop
+
+    def log_message(self, *args):
+        pass
+
+
+class XMLRPCHandler(xmlrpc.server.SimpleXMLRPCRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingXMLRPCServer(socketserver.ThreadingMixIn,
+                            xmlrpc.server.SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class TestPysubConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingServer(("127.0.0.1", 0), KeepAliveHandler)
+        self.server.clients = set()
+        self.server.drop = False
+        self.url = "http://127.0.0.1:{}/sub.gz".format(
+            self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, args=(0.05,),
+                         daemon=True).start()
+        self.pool = ConnectionPool(timeout=5)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self):
+        with self.pool.get(self.url) as response:
+            return response.read()
+
+    def test_reuse(self):
+        self.assertEqual(self.get(), b"subtitle")
+        self.assertEqual(self.get(), b"subtitle")
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_dropped_connection(self):
+        self.server.drop = True
+        self.assertEqual(self.get(), b"subtitle")
+        # idle connection was closed by server, request is retried
+        self.assertEqual(self.get(), b"subtitle")
+        self.assertEqual(len(self.server.clients), 2)
+
+    def test_error_closes_connection(self):
+        with self.assertRaises(ValueError):
+            with self.pool.get(self.url):
+                raise ValueError
+        self.assertFalse(any(self.pool._idle.values()))
+
+    def test_close(self):
+        self.get()
+        connection = self.pool._idle[('http', self.url.split('/')[2])][0]
+        self.pool.close()
+        self.assertEqual(self.pool._idle, {})
+        self.assertIsNone(connection.sock)
+
+    def test_pooled_transport(self):
+        server = ThreadingXMLRPCServer(("127.0.0.1", 0), XMLRPCHandler,
+                                       logRequests=False)
+        server.register_function(lambda: "pong", "ping")
+        threading.Thread(target=server.serve_forever, args=(0.05,),
+                         daemon=True).start()
+        host = "127.0.0.1:{}".format(server.server_address[1])
+        try:
+            proxy = xmlrpc.client.ServerProxy(
+                "http://{}/".format(host),
+                transport=PooledTransport(self.pool))
+            self.assertEqual(proxy.ping(), "pong")
+            connection = self.pool._idle[('http', host)][0]
+            self.assertEqual(proxy.ping(), "pong")
+            self.assertEqual(self.pool._idle[('http', host)], [connection])
+        finally:
+            self.pool.close()
+            server.shutdown()
+            server.server_close()
+
+        # connection failed, nothing is returned to the pool
+        self.assertRaises(OSError, proxy.ping)
+        self.assertFalse(any(self.pool._idle.values()))
+
+
+class TestPysubRateLimiter(unittest.TestCase):
+
+    def test_status_code(self):
+        self.assertEqual(status_code("429 Too Many Requests"), 429)
+        self.assertIsNone(status_code(None))
+        self.assertIsNone(status_code(""))
+
+    def test_backoff_delay(self):
+        limiter = RateLimiter(base_delay=1.0, max_delay=10.0)
+        for attempt, delay in ((0, 1.0), (2, 4.0), (8, 10.0)):
+            self.assertTrue(delay / 2 <= limiter.backoff_delay(attempt)
+                            <= delay)
+
+    def test_throttled(self):
+        limiter = RateLimiter(rate=4.0, min_rate=1.5, base_delay=0)
+        limiter.throttled()
+        self.assertEqual(limiter.rate, 2.0)
+        limiter.throttled()
+        self.assertEqual(limiter.rate, 1.5)
+        for _ in range(20):
+            limiter.succeeded()
+        self.assertEqual(limiter.rate, 4.0)
+
+    def test_call_throttled(self):
+        limiter = RateLimiter(rate=0, base_delay=0)
+        server = OpenSubtitlesServer("http://localhost", "ua", "eng",
+                                     limiter=limiter)
+        proxy = mock.Mock()
+        proxy.SearchSubtitles.side_effect = [{'status': "429 Too Many"},
+                                             {'status': "200 OK"}]
+        with mock.patch.object(OpenSubtitlesServer, 'server', proxy):
+            self.assertEqual(server.query([{}], attempts=1),
+                             {'status': "200 OK"})
+        self.assertEqual(proxy.SearchSubtitles.call_count, 2)
+        self.assertEqual(limiter.rate, 0)
+
+
+class TestPysubShard(unittest.TestCase):
+
+    def test_shard_key(self):
+        root = os.path.join(os.sep, "mnt", "tv")
+        path = os.path.join(root, "Show", "Season 1", "Show.S01E02.mkv")
+        self.assertEqual(shard_key(path, root),
+                         "Show/Season 1/Show.S01E02.mkv")
+        self.assertEqual(shard_key(path, root, by='directory'),
+                         "Show/Season 1")
+
+    def test_consistent(self):
+        keys = ["Show/Show.S01E{:02d}.mkv".format(num) for num in range(400)]
+        three = HashRing(3)
+        four = HashRing(4)
+        self.assertEqual([three.shard(key) for key in keys],
+                         [HashRing(3).shard(key) for key in keys])
+        self.assertEqual(set(three.shard(key) for key in keys), {0, 1, 2})
+        moved = [key for key in keys if three.shard(key) != four.shard(key)]
+        # only keys taken over by the new shard move
+        self.assertTrue(all(four.shard(key) == 3 for key in moved))
+        self.assertLess(len(moved), len(keys) / 2)
+
+    def test_partition_by_directory(self):
+        root = os.path.join(os.sep, "tv")
+        paths = [os.path.join(root, "Show {}".format(show),
+                              "E{}.mkv".format(episode))
+                 for show in range(10) for episode in range(5)]
+        shards = partition(paths, root, 3, by='directory')
+        self.assertEqual(sorted(sum(shards, [])), sorted(paths))
+        for shard in shards:
+            for path in shard:
+                folder = os.path.dirname(path)
+                self.assertEqual(len([other for other in paths
+                                      if os.path.dirname(other) == folder]),
+                                 len([other for other in shard
+                                      if os.path.dirname(other) == folder]))
+
+
+class TestPysubStore(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = SQLiteStore(os.path.join(self.folder, "store.db"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.folder)
+
+    def test_values(self):
+        self.assertIsNone(self.store.get('results', 'a'))
+        self.store.set('results', 'b', {'status': 'downloaded'})
+        self.store.set('results', 'a', [1, 2])
+        self.assertEqual(self.store.get('results', 'a')[0], [1, 2])
+        self.assertEqual([key for key, _ in self.store.items('results')],
+                         ['a', 'b'])
+        self.store.expire('results', -1)
+        self.assertEqual(self.store.items('results'), [])
+
+    def test_take(self):
+        other = SQLiteStore(self.store.path)
+        self.assertEqual(self.store.take('api', 1.0, 2), 0)
+        self.assertEqual(other.take('api', 1.0, 2), 0)
+        self.assertGreater(self.store.take('api', 1.0, 2), 0.5)
+        other.pause('api', 30)
+        self.assertGreater(self.store.take('api', 100.0, 2), 29)
+        other.close()
+
+    def test_shared_limiter(self):
+        limiter = RateLimiter(rate=1.0, burst=1, base_delay=10)
+        limiter.use_store(self.store)
+        limiter.acquire()
+        self.assertGreater(self.store.take('api', 1.0, 1), 0.5)
+        limiter.throttled()
+        self.assertGreater(self.store.take('api', 1.0, 1), 4)
+
+    def test_search_cache(self):
+        cache = SharedSearchCache(self.store, ttl=60, negative_ttl=-1)
+        cache.set({'query': 'Show S01E02'}, [{'IDSubtitleFile': '1'}])
+        cache.set({'query': 'Other S01E02'}, [])
+        other = SharedSearchCache(self.store)
+        self.assertEqual(other.get({'query': 'show s01e02'}),
+                         [{'IDSubtitleFile': '1'}])
+        self.assertIsNone(cache.get({'query': 'Other S01E02'}))
+
+    def test_abstract(self):
+        self.assertRaises(TypeError, SharedStore)
+
+    def test_load_shard(self):
+        config = dict(pysub.config, store=self.store.path, shard=1,
+                      shards=1, shard_by='path')
+        os.mkdir(os.path.join(self.folder, "Show"))
+        video_path = os.path.join(self.folder, "Show", "a.mkv")
+        open(video_path, "w").close()
+        with mock.patch('builtins.print'):
+            shards = pysub.coordinate([video_path], self.folder,
+                                      dict(config, shards=2))
+            self.assertEqual(pysub.load_shard(self.folder, config),
+                             shards[1])
+            self.assertEqual(config['shards'], 2)
+            config['shard'] = 0
+            self.assertEqual(pysub.load_shard(self.folder, config),
+                             shards[0])
+
+            self.store.set('shards', 'plan', {'shards': 3, 'by': 'path'})
+            config['shard'] = 2
+            self.assertIsNone(pysub.load_shard(self.folder, config))
+
+    def test_shard_out_of_range(self):
+        # workers never fall back to splitting the folder themselves
+        video_path = os.path.join(self.folder, "a.mkv")
+        open(video_path, "w").close()
+        argv = ["pysub", "--store", self.store.path, "--shard", "5",
+                self.folder]
+        with mock.patch("sys.argv", argv), \
+                mock.patch.dict(pysub.config), \
+                mock.patch.object(pysub, "run_worker") as run_worker, \
+                mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            self.assertRaises(SystemExit, pysub.main)
+            self.assertIn("No shards saved", output.getvalue())
+
+            pysub.coordinate([video_path], self.folder,
+                             dict(pysub.config, shards=2, shard_by='path'))
+            self.assertRaises(SystemExit, pysub.main)
+            self.assertIn("Shard must be from 0 to 1", output.getvalue())
+        self.assertFalse(run_worker.called)
+
+
+class TestPysubScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        for name in ("b.mkv", "a.avi", "a.avi.srt", "notes.txt",
+                     os.path.join("Season 1", "s01e01.mkv")):
+            path = os.path.join(self.folder, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_scan(self):
+        scanner = Scanner([".mkv", ".avi"], [".srt"])
+        self.assertEqual(scanner.scan(self.folder),
+                         [os.path.join(self.folder, "a.avi"),
+                          os.path.join(self.folder, "b.mkv")])
+        self.assertEqual(scanner.subtitles[self.folder], {"a.avi.srt"})
+
+    def test_scan_recursive(self):
+        scanner = Scanner([".mkv"])
+        self.assertEqual(scanner.scan(self.folder, recursive=True),
+                         [os.path.join(self.folder, "b.mkv"),
+                          os.path.join(self.folder, "Season 1",
+                                       "s01e01.mkv")])
+
+    def test_skip_unchanged(self):
+        cache_folder = tempfile.mkdtemp()
+        cache = DirectoryCache(os.path.join(cache_folder, "dirs.db"))
+        first = Scanner([".mkv"], directory_cache=cache)
+        self.assertEqual(len(first.scan(self.folder, recursive=True)), 2)
+        first.commit()
+
+        open(os.path.join(self.folder, "Season 1", "s01e02.mkv"), "w").close()
+        second = Scanner([".mkv"], directory_cache=cache)
+        self.assertEqual(second.scan(self.folder, recursive=True),
+                         [os.path.join(self.folder, "Season 1",
+                                       "s01e01.mkv"),
+                          os.path.join(self.folder, "Season 1",
+                                       "s01e02.mkv")])
+        self.assertEqual(second.skipped, 1)
+        cache.close()
+        shutil.rmtree(cache_folder)
+
+    def test_commit_done(self):
+        cache_folder = tempfile.mkdtemp()
+        cache = DirectoryCache(os.path.join(cache_folder, "dirs.db"))
+        first = Scanner([".mkv"], directory_cache=cache)
+        first.scan(self.folder, recursive=True)
+        self.assertIsNone(cache.get(self.folder))
+        first.commit(lambda file_path: file_path.endswith("b.mkv"))
+
+        second = Scanner([".mkv"], directory_cache=cache)
+        self.assertEqual(second.scan(self.folder, recursive=True),
+                         [os.path.join(self.folder, "Season 1",
+                                       "s01e01.mkv")])
+        self.assertEqual(second.skipped, 1)
+        cache.close()
+        shutil.rmtree(cache_folder)
+
+    def test_scan_extension_case(self):
+        open(os.path.join(self.folder, "C.MKV"), "w").close()
+        scanner = Scanner([".mkv"])
+        self.assertEqual(scanner.scan(self.folder),
+                         [os.path.join(self.folder, "C.MKV"),
+                          os.path.join(self.folder, "b.mkv")])
+
+    def test_commit_reuses_listings(self):
+        scanner = Scanner([".mkv", ".avi"], [".srt"])
+        scanner.scan(self.folder)
+        index = SubtitleIndex([".srt"], scanner.subtitles)
+        config = dict(pysub.config, lang="eng", subfolder=None,
+                      sub_ext=[".srt"])
+        index.add(os.path.join(self.folder, "b.mkv.srt"))
+        with mock.patch("os.scandir", side_effect=AssertionError):
+            self.assertTrue(pysub.has_subtitles(
+                os.path.join(self.folder, "a.avi"), config, index))
+            self.assertTrue(pysub.has_subtitles(
+                os.path.join(self.folder, "b.mkv"), config, index))
+
+    def test_subtitle_index(self):
+        index = SubtitleIndex([".srt", ".sub"])
+        self.assertTrue(index.exists(self.folder, ["a.avi", "a"]))
+        self.assertFalse(index.exists(self.folder, ["b.mkv", "b"]))
+        self.assertFalse(index.exists(os.path.join(self.folder, "Subs"),
+                                      ["a.avi", "a"]))
+
+    def test_subtitle_index_case(self):
+        open(os.path.join(self.folder, "c.mkv"), "w").close()
+        open(os.path.join(self.folder, "c.mkv.SRT"), "w").close()
+        scanner = Scanner([".mkv"], [".srt"])
+        scanner.scan(self.folder)
+        index = SubtitleIndex([".SRT"], scanner.subtitles)
+        with mock.patch("os.scandir", side_effect=AssertionError):
+            self.assertTrue(index.exists(self.folder, ["c.mkv", "c"]))
+        self.assertTrue(SubtitleIndex([".srt"]).exists(self.folder,
+                                                       ["c.mkv", "c"]))
+
+    def test_subtitle_index_listings(self):
+        scanner = Scanner([".mkv"], [".srt"])
+        scanner.scan(self.folder + os.sep)
+        index = SubtitleIndex([".srt"], scanner.subtitles)
+        os.remove(os.path.join(self.folder, "a.avi.srt"))
+        self.assertTrue(index.exists(self.folder, ["a.avi"]))
+
+
+class TestPysubMetrics(unittest.TestCase):
+
+    def test_histogram(self):
+        metrics = Metrics()
+        for seconds in (0.0001, 0.002, 0.002, 60):
+            metrics.observe('hash', seconds)
+        metrics.count('hash_bytes', 131072)
+        summary = metrics.summary()
+        timer = summary['timers']['hash']
+        self.assertEqual(timer['count'], 4)
+        self.assertEqual(timer['histogram']['0.0005'], 1)
+        self.assertEqual(timer['histogram']['0.005'], 3)
+        self.assertEqual(timer['histogram']['30.0'], 3)
+        self.assertEqual(timer['histogram']['+Inf'], 4)
+        self.assertEqual(summary['counters'], {'hash_bytes': 131072})
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        with metrics.timer('download'):
+            pass
+        metrics.count('downloads')
+        text = metrics.to_prometheus()
+        self.assertIn("pysub_downloads_total 1\n", text)
+        self.assertIn('pysub_download_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn("pysub_download_seconds_count 1\n", text)
+
+
+class TestPysubWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.watcher = Watcher([".mkv"], settle=5, use_inotify=False)
+        self.watcher.add(self.folder)
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.folder)
+
+    def write(self, name, content):
+        path = os.path.join(self.folder, name)
+        with open(path, "ab") as video:
+            video.write(content)
+        return path
+
+    def test_ready_when_settled(self):
+        path = self.write("a.mkv", b"\0")
+        self.watcher.retry([path, self.write("a.txt", b"\0")])
+        self.assertEqual(self.watcher.ready(now=0), [])
+        self.write("a.mkv", b"\0")
+        self.assertEqual(self.watcher.ready(now=4), [])
+        self.assertEqual(self.watcher.ready(now=8), [])
+        self.assertEqual(self.watcher.ready(now=9), [path])
+        self.assertEqual(self.watcher.ready(now=20), [])
+
+    def test_existing_not_reported(self):
+        self.write("old.mkv", b"\0")
+        watcher = Watcher([".mkv"], use_inotify=False)
+        watcher.add(self.folder)
+        path = self.write("new.mkv", b"\0")
+        self.assertEqual(watcher.backend.changes(0), ([path], []))
+
+    def test_inotify_fallback(self):
+        other = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other)
+        path = self.write("a.mkv", b"\0")
+        backend = mock.Mock(folders=[self.folder])
+        backend.add.side_effect = OSError(28, "No space left on device")
+        backend.changes.return_value = ([path], [])
+        self.watcher.backend = backend
+        with mock.patch('builtins.print'):
+            self.watcher.add(other)
+        self.assertTrue(backend.close.called)
+        self.assertEqual(self.watcher.backend._folders, {self.folder, other})
+        # change inotify reported before falling back isn't lost
+        self.assertEqual(self.watcher.ready(now=0), [])
+        self.assertEqual(self.watcher.ready(now=10), [path])
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file